@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from components.EstimatedSocialNetwork import FrozenSocialNetwork
+from components.Tournament import DEFAULT_CONFIG, build_game, run_game
+
+SIZES = [5, 50, 200, 1000]
+MC_TRIALS = [100, 1000, 10000]
+
+
+def setup_game(n_contestants, seed=0):
+    return build_game({**DEFAULT_CONFIG, "n_contestants": n_contestants}, seed)
+
+
+def bench_sample_trust(n_contestants, mc_trials):
+    net = setup_game(n_contestants)
+    return net.sample_trust
+
+
+def bench_simulate_vote(n_contestants, mc_trials):
+    net = setup_game(n_contestants)
+    return net.simulate_vote
+
+
+def bench_interaction_phase(n_contestants, mc_trials):
+    net = setup_game(n_contestants)
+    return net.interaction_phase
+
+
+def bench_gossip_phase(n_contestants, mc_trials):
+    net = build_game(
+        {**DEFAULT_CONFIG, "n_contestants": n_contestants, "gossip_rate": 0.5}, seed=0
+    )
+    net.sample_trust()
+    # A few rounds of interactions, so that beliefs differ from the base
+    for _ in range(3):
+        net.interaction_phase()
+    return net.gossip_phase
+
+
+def bench_generate_estimated_social_network(n_contestants, mc_trials):
+    net = setup_game(n_contestants)
+
+    def generate():
+        # As in build_game, from contestants without estimated networks
+        for c in net.iter_contestants():
+            c.estimated_social_network = None
+        base = FrozenSocialNetwork(net)
+        for c in net.iter_contestants():
+            c.generate_estimated_social_network(base)
+
+    return generate
+
+
+def bench_MC_simulate_games(n_contestants, mc_trials):
+    contestant = setup_game(n_contestants).get_all_contestants()[0]
+    return lambda: contestant.MC_simulate_games(
+        mc_trials, batched=True, use_cache=False
+    )
+
+
+def bench_MC_simulate_games_loop(n_contestants, mc_trials):
+    contestant = setup_game(n_contestants).get_all_contestants()[0]
+    return lambda: contestant.MC_simulate_games(mc_trials, use_cache=False)
+
+
+def bench_MC_simulate_games_incremental(n_contestants, mc_trials):
+    contestant = setup_game(n_contestants).get_all_contestants()[0]
+    return lambda: contestant.MC_simulate_games(
+        mc_trials, incremental=True, use_cache=False
+    )
+
+
+def bench_import_core(n_contestants, mc_trials):
+    """Fresh interpreter importing the simulation core, as every process pool worker does."""
+    command = [sys.executable, "-c", "import components.Tournament"]
+    root = os.path.dirname(os.path.abspath(__file__))
+    return lambda: subprocess.run(command, check=True, cwd=root)
+
+
+def bench_full_game(n_contestants, mc_trials):
+    config = {**DEFAULT_CONFIG, "n_contestants": n_contestants}
+    return lambda: run_game(config, seed=0)
+
+
+# name -> (setup function returning the callable to time, largest size, whether MC trials are swept)
+# A largest size of 0 marks benchmarks which do not depend on the size, run once with N=None.
+BENCHMARKS = {
+    "import_core": (bench_import_core, 0, False),
+    "sample_trust": (bench_sample_trust, None, False),
+    "simulate_vote": (bench_simulate_vote, None, False),
+    "interaction_phase": (bench_interaction_phase, None, False),
+    "gossip_phase": (bench_gossip_phase, 200, False),
+    "generate_estimated_social_network": (
+        bench_generate_estimated_social_network,
+        200,
+        False,
+    ),
+    "MC_simulate_games": (bench_MC_simulate_games, None, True),
+    "MC_simulate_games_loop": (bench_MC_simulate_games_loop, 50, True),
+    "MC_simulate_games_incremental": (bench_MC_simulate_games_incremental, 200, True),
+    "full_game": (bench_full_game, 200, False),
+}
+
+
+def measure(func, repeats):
+    """Returns (times in seconds, peak traced memory in bytes) of calling `func`."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    # Memory is traced in a separate call, as tracing slows down the timed ones
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return times, peak
+
+
+def run(names, sizes, mc_trials, repeats, full=False):
+    results = []
+    for name in names:
+        setup, max_size, sweeps_trials = BENCHMARKS[name]
+        for n_contestants in [None] if max_size == 0 else sizes:
+            if max_size and n_contestants > max_size and not full:
+                continue
+            for trials in mc_trials if sweeps_trials else [None]:
+                if name == "MC_simulate_games_loop" and trials > 1000 and not full:
+                    continue
+                func = setup(n_contestants, trials)
+                times, peak = measure(func, repeats)
+                result = {
+                    "name": name,
+                    "n_contestants": n_contestants,
+                    "mc_trials": trials,
+                    "repeats": repeats,
+                    "time_min": min(times),
+                    "time_median": statistics.median(times),
+                    "peak_memory_bytes": peak,
+                }
+                print(
+                    f"{name:36} N={str(n_contestants):<5} trials={str(trials):<6} "
+                    f"min={result['time_min']:.6f}s peak={peak / 2**20:.1f}MiB",
+                    flush=True,
+                )
+                results.append(result)
+    return results
+
+
+def compare(baseline_filename, filename, threshold):
+    """
+    Prints the time and memory ratio of each benchmark in `filename` against `baseline_filename`.
+    :return: the number of benchmarks slower than `threshold` times the baseline
+    """
+    with open(baseline_filename) as f:
+        baseline = {_key(r): r for r in json.load(f)["results"]}
+    with open(filename) as f:
+        results = json.load(f)["results"]
+    regressions = 0
+    print(f"{'benchmark':60} {'time':>8} {'memory':>8}")
+    for r in results:
+        key = _key(r)
+        if key not in baseline:
+            continue
+        time_ratio = r["time_min"] / baseline[key]["time_min"]
+        memory_ratio = r["peak_memory_bytes"] / max(
+            1, baseline[key]["peak_memory_bytes"]
+        )
+        flag = ""
+        if time_ratio > threshold:
+            regressions += 1
+            flag = "  SLOWER"
+        label = f"{r['name']} N={r['n_contestants']} trials={r['mc_trials']}"
+        print(f"{label:60} {time_ratio:8.2f} {memory_ratio:8.2f}{flag}")
+    return regressions
+
+
+def _key(result):
+    return result["name"], result["n_contestants"], result["mc_trials"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the simulation hot paths.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="Run benchmarks and save the results"
+    )
+    run_parser.add_argument("output", help="JSON results file, e.g. baseline.json")
+    run_parser.add_argument(
+        "--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS)
+    )
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    run_parser.add_argument("--mc-trials", type=int, nargs="+", default=MC_TRIALS)
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Also run the slow benchmarks at the sizes they are skipped for by default",
+    )
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare results against a baseline"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="Time ratio above which a benchmark is slower",
+    )
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(
+            args.benchmarks, args.sizes, args.mc_trials, args.repeats, args.full
+        )
+        meta = {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        }
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Results saved to {args.output}")
+    else:
+        regressions = compare(args.baseline, args.results, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import numpy as np
+
+from components import MonteCarlo
+from components.Signals import SplitSignal
+
+# Points of the integration grid of each uncertain candidate, in standard deviations from its mean
+GRID = np.concatenate([[-40.0], np.linspace(-8, 8, 129), [40.0]])
+# Chebyshev fit of erfc, highest power first
+ERFC_COEFFICIENTS = [
+    0.17087277,
+    -0.82215223,
+    1.48851587,
+    -1.13520398,
+    0.27886807,
+    -0.18628806,
+    0.09678418,
+    0.37409196,
+    1.00002368,
+    -1.26551223,
+]
+
+
+def next_vote_distribution(net, max_states=100000):
+    """
+    Deterministic alternative to sampling the next vote of `net`, when every voter uses
+    TrustVoteChoice: see vote_probabilities and eviction_probabilities.
+    Returns {1: {contestant or SplitSignal: probability}}, as round 1 of MC_simulate_games.
+    """
+    contestants = net.get_all_contestants()
+    trust_mean, trust_var, thresholds = MonteCarlo.network_state(net)
+    probabilities = eviction_probabilities(
+        vote_probabilities(trust_mean, trust_var, thresholds), max_states
+    )
+    outcomes = contestants + [SplitSignal]
+    return {
+        1: {outcomes[k]: float(probabilities[k]) for k in np.flatnonzero(probabilities)}
+    }
+
+
+def vote_probabilities(trust_mean, trust_var, thresholds, immune=None):
+    """
+    Vote distribution of every TrustVoteChoice voter, whose trust towards each candidate is
+    Gaussian with mean trust_mean and sigma trust_var (N x N, as in MC simulations).
+    Voter i votes for candidate j if their trust towards j is the lowest and at most
+    thresholds[i], with probability
+        integral up to min(threshold, lowest certain trust) of f_j(x) prod_k!=j (1 - F_k(x)) dx
+    over the candidates with uncertain trust. This is integrated on a grid holding GRID points
+    around each of them (accurate to about 1e-5). Candidates with certain trust only get votes
+    at that trust, shared equally on ties.
+    :return: (N, N + 1) array, [i, j] the probability that voter i votes for contestant j, and
+        [i, N] that they split
+    """
+    n_contestants = len(thresholds)
+    immune = np.zeros(n_contestants, dtype=bool) if immune is None else immune
+    probabilities = np.zeros((n_contestants, n_contestants + 1))
+    for i in range(n_contestants):
+        candidates = np.isfinite(trust_mean[i]) & ~immune
+        candidates[i] = False
+        probabilities[i, :n_contestants] = _vote_row(
+            trust_mean[i], trust_var[i], candidates, thresholds[i]
+        )
+    probabilities[:, n_contestants] = np.maximum(
+        0.0, 1 - probabilities[:, :n_contestants].sum(axis=1)
+    )
+    return probabilities
+
+
+def eviction_probabilities(vote_probabilities, max_states=100000):
+    """
+    Combines independent votes into the distribution of the outcome of the vote, counted as in
+    SocialNetwork.count_votes: the most voted contestant, ties going to the one voted for first,
+    or a split if every voter split.
+    Exact: votes are added voter by voter to the distribution of (vote counts, order in which
+    contestants got their first vote). This stays small when few voters are uncertain, as in
+    estimated networks, but can grow exponentially; past `max_states` a ValueError is raised.
+    :return: (N + 1,) probabilities of evicting each contestant, and of a split last
+    """
+    n_contestants = vote_probabilities.shape[1] - 1
+    # Only contestants who may get a vote need a count
+    voted = np.flatnonzero(vote_probabilities[:, :n_contestants].any(axis=0))
+    column = {j: k for k, j in enumerate(voted.tolist())}
+    states = {((0,) * len(voted), ()): 1.0}
+    for row in vote_probabilities:
+        outcomes = [(column.get(j), p) for j, p in enumerate(row.tolist()) if p > 0]
+        next_states = {}
+        for (counts, order), probability in states.items():
+            for k, p in outcomes:
+                if k is None:
+                    key = (counts, order)
+                else:
+                    key = (
+                        counts[:k] + (counts[k] + 1,) + counts[k + 1 :],
+                        order if counts[k] else order + (k,),
+                    )
+                next_states[key] = next_states.get(key, 0.0) + probability * p
+        states = next_states
+        if len(states) > max_states:
+            raise ValueError(
+                f"More than {max_states} vote outcomes, sample the vote instead"
+            )
+    probabilities = np.zeros(n_contestants + 1)
+    for (counts, order), probability in states.items():
+        if order:
+            # max keeps the first of equal counts, so ties go to the first voted for
+            probabilities[voted[max(order, key=counts.__getitem__)]] += probability
+        else:
+            probabilities[n_contestants] += probability
+    return probabilities
+
+
+def _vote_row(trust_mean, trust_var, candidates, threshold):
+    """Probabilities that a voter votes for each contestant, see vote_probabilities."""
+    probabilities = np.zeros(len(trust_mean))
+    uncertain = np.flatnonzero(candidates & (trust_var > 0))
+    certain = candidates & (trust_var == 0)
+    lowest_certain = trust_mean[certain].min(initial=np.inf)
+    upper = min(threshold, lowest_certain)
+    mean, sigma = trust_mean[uncertain, None], trust_var[uncertain, None]
+    if len(uncertain):
+        points = (mean + sigma * GRID).ravel()
+        points = np.sort(np.append(points[points < upper], upper))
+        survival = _normal_sf((points - mean) / sigma)
+        log_survival = np.log(np.maximum(survival, 1e-300))
+        # Probability that every other uncertain candidate is trusted more than each point
+        others = np.exp(log_survival.sum(axis=0) - log_survival)
+        # Stieltjes sum of `others` against the distribution of each candidate's trust
+        probabilities[uncertain] = (1 - survival[:, 0]) * others[:, 0] + (
+            -np.diff(survival, axis=1) * (others[:, 1:] + others[:, :-1]) / 2
+        ).sum(axis=1)
+    if lowest_certain <= threshold:
+        tied = certain & (trust_mean == lowest_certain)
+        probabilities[tied] = (
+            _normal_sf((lowest_certain - mean[:, 0]) / sigma[:, 0]).prod() / tied.sum()
+        )
+    return probabilities
+
+
+def _normal_sf(z):
+    """1 - Phi(z), vectorized, with a relative error below 1.2e-7 (Numerical Recipes' erfcc)."""
+    x = np.abs(z) / np.sqrt(2)
+    t = 1 / (1 + 0.5 * x)
+    erfc = t * np.exp(-x * x + np.polyval(ERFC_COEFFICIENTS, t))
+    return np.where(z >= 0, erfc / 2, 1 - erfc / 2)
@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+
+class AgentBackend:
+    """
+    Where the policies of BackendVoteChoice and BackendInteractionChoice contestants run.
+    Requests of one kind ("vote" or "interaction") submitted in the same iteration of the event
+    loop, such as those of a whole concurrent phase, are sent to `query` as a single batch.
+    """
+
+    def __init__(self):
+        # kind -> [(request, future)] waiting to be sent
+        self._pending = {}
+        # Batches being sent, referenced so that their tasks are not garbage collected
+        self._sending = set()
+
+    async def submit(self, kind, request):
+        """Queues `request` into the next batch of `kind` and returns its response."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(kind, [])
+        if not pending:
+            # Runs once every request already scheduled in this iteration has been queued
+            loop.call_soon(self._flush, kind)
+        pending.append((request, future))
+        return await future
+
+    async def query(self, kind, requests):
+        """Returns the responses of the policy to a batch of requests, in order."""
+        raise Exception("This function should be overwritten by derived class!")
+
+    def _flush(self, kind):
+        batch = self._pending.pop(kind)
+        task = asyncio.ensure_future(self._send(kind, batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, kind, batch):
+        try:
+            responses = await self.query(kind, [request for request, _ in batch])
+        except Exception as e:
+            responses = [e] * len(batch)
+        for (_, future), response in zip(batch, responses):
+            # Requests may have timed out, and their futures been cancelled
+            if future.done():
+                continue
+            if isinstance(response, Exception):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+
+
+class LocalBackend(AgentBackend):
+    """
+    Runs `policy(kind, requests) -> responses` in-process, in a worker thread so that slow
+    policies do not block the other backends. The policy only sees JSON-like requests.
+    """
+
+    def __init__(self, policy):
+        super().__init__()
+        self.policy = policy
+
+    async def query(self, kind, requests):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.policy, kind, requests
+        )
+
+
+class UnixSocketBackend(AgentBackend):
+    """
+    Sends each batch to a policy server listening on the Unix socket `path`, as one JSON line
+    {"kind": kind, "requests": [...]}, and reads back one line {"responses": [...]}.
+    See serve_policy for a local stand-in server.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    async def query(self, kind, requests):
+        # A connection per batch, so that the backend is not tied to one event loop
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            message = {"kind": kind, "requests": requests}
+            writer.write((json.dumps(message) + "\n").encode())
+            await writer.drain()
+            line = await reader.readline()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+        if not line:
+            raise ConnectionError(
+                f"The policy server at {self.path} closed the connection"
+            )
+        return json.loads(line)["responses"]
+
+
+async def serve_policy(path, policy):
+    """
+    Stand-in policy server: answers the batches of UnixSocketBackend clients on the Unix socket
+    `path` with `policy(kind, requests)`. Returns the asyncio server.
+    """
+
+    async def handle(reader, writer):
+        while line := await reader.readline():
+            message = json.loads(line)
+            responses = policy(message["kind"], message["requests"])
+            writer.write((json.dumps({"responses": responses}) + "\n").encode())
+            await writer.drain()
+        writer.close()
+
+    return await asyncio.start_unix_server(handle, path)
+
+
+def run_sync(coroutine):
+    """
+    Runs the `coroutine` of a backend strategy from synchronous code, such as the `choose` of
+    BackendVoteChoice called by a loop MC simulation. This needs its own event loop, so it cannot
+    be done from a coroutine: await the coroutine instead (as Contestant.MC_simulate_games_async
+    does for simulated votes), or run the synchronous code in an executor.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    coroutine.close()
+    raise RuntimeError(
+        "Backend strategies cannot be called synchronously from a running event loop: "
+        "await choose_async, or run the caller in an executor"
+    )
+
+
+def threshold_policy(kind, requests):
+    """
+    Example policy. Votes go to the least trusted candidate (the first one on ties), or split
+    when everyone is trusted above the threshold. Interactions ask the first neighbour to
+    trust the interactor more.
+    Vote requests are {"voter": name, "threshold": float, "candidates": {name: trust}} and get
+    a name, or None to split. Interaction requests are {"interactor": name,
+    "neighbours": {name: [names of their neighbours]}} and get {"interacted": name,
+    "target": name, "increase": bool}, or None to not interact.
+    """
+    responses = []
+    for request in requests:
+        if kind == "vote":
+            candidates = request["candidates"]
+            lowest = min(candidates, key=candidates.get, default=None)
+            if lowest is None or candidates[lowest] > request["threshold"]:
+                lowest = None
+            responses.append(lowest)
+        else:
+            neighbours = list(request["neighbours"])
+            responses.append(
+                {
+                    "interacted": neighbours[0],
+                    "target": request["interactor"],
+                    "increase": True,
+                }
+                if neighbours
+                else None
+            )
+    return responses
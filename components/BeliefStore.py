@@ -0,0 +1,169 @@
+import numpy as np
+
+from components.MonteCarlo import MAX_CHUNK_ENTRIES
+
+FIELDS = ("trust_mean", "trust_var")
+# Side of the square tiles of beliefs: a float32 tile is one 4 KiB page
+TILE = 32
+
+
+class BeliefStore:
+    """
+    Memory-mapped storage for the overlays of every estimated social network built on one base:
+    a single float32 tensor in `filename`, in which block [k, f] holds the N x N trust_mean (f = 0)
+    or trust_var (f = 1) beliefs of network k, N being the number of contestants of the base.
+    Beliefs are stored as differences from the base, so zero means "same as the base". The file
+    is created sparse, so only the pages of entries ever written take disk space and memory.
+    Blocks are laid out in TILE x TILE tiles, so that a row or a column of beliefs (such as
+    the uncertain trust of everyone towards the owner) touches N / TILE pages rather than N.
+    Blocks are scanned in chunks of at most MAX_CHUNK_ENTRIES entries.
+    """
+
+    def __init__(self, filename, names, n_networks=None):
+        self.filename = filename
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+        n_networks = n if n_networks is None else n_networks
+        n_tiles = max(1, -(-n // TILE))
+        # Entry [a, b] of block [k, f] is deltas[k, f, a // TILE, b // TILE, a % TILE, b % TILE]
+        self.deltas = np.memmap(
+            filename,
+            dtype=np.float32,
+            mode="w+",
+            shape=(n_networks, 2, n_tiles, n_tiles, TILE, TILE),
+        )
+        self.n_networks = 0
+
+    def allocate(self):
+        """Hands out the block of the next estimated network."""
+        if self.n_networks == len(self.deltas):
+            raise ValueError(
+                f"The belief store {self.filename} holds {len(self.deltas)} networks at most"
+            )
+        self.n_networks += 1
+        return self.n_networks - 1
+
+    def overlay(self, network, field, base_values):
+        """Dict-of-dicts view of the `field` overlay of `network`, see BeliefOverlay."""
+        return BeliefOverlay(self, network, FIELDS.index(field), base_values)
+
+    def flush(self):
+        self.deltas.flush()
+
+
+class BeliefOverlay:
+    """
+    Stands in for the {source name: {target name: value}} overlay dict of an EstimatedSocialNetwork,
+    reading and writing one block of a BeliefStore. `base_values` is the N x N base array of the
+    field, to which the stored differences are added.
+    """
+
+    def __init__(self, store, network, field, base_values):
+        self.store = store
+        self.block = store.deltas[network, field]
+        self.base_values = base_values
+
+    def entries(self):
+        """Returns (sources, targets, values) arrays of the entries which differ from the base."""
+        n_tiles = len(self.block)
+        chunk_size = max(1, MAX_CHUNK_ENTRIES // (n_tiles * TILE * TILE))
+        sources, targets, values = [], [], []
+        for start in range(0, n_tiles, chunk_size):
+            chunk = np.asarray(self.block[start : start + chunk_size])
+            tile_rows, tile_cols, rows, cols = np.nonzero(chunk)
+            deltas = chunk[tile_rows, tile_cols, rows, cols]
+            rows += (start + tile_rows) * TILE
+            cols += tile_cols * TILE
+            sources.append(rows)
+            targets.append(cols)
+            values.append(self.base_values[rows, cols] + deltas)
+        return np.concatenate(sources), np.concatenate(targets), np.concatenate(values)
+
+    def dense(self, ids):
+        """Beliefs between the contestant ids `ids` (indices into the base), as an array."""
+        tiles, offsets = np.divmod(ids, TILE)
+        deltas = self.block[
+            tiles[:, None], tiles[None, :], offsets[:, None], offsets[None, :]
+        ]
+        return self.base_values[np.ix_(ids, ids)] + deltas
+
+    def row(self, i):
+        """Stored differences of row i, as an (N,) array."""
+        n = len(self.base_values)
+        return self.block[i // TILE, :, i % TILE, :].reshape(-1)[:n]
+
+    def cell(self, i, j):
+        return i // TILE, j // TILE, i % TILE, j % TILE
+
+    def __getitem__(self, name):
+        return BeliefRow(self, self.store.index[name])
+
+    def __contains__(self, name):
+        i = self.store.index.get(name)
+        return i is not None and bool(self.row(i).any())
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def setdefault(self, name, default=None):
+        return self[name]
+
+    def keys(self):
+        sources, _, _ = self.entries()
+        return [self.store.names[i] for i in np.unique(sources).tolist()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+
+class BeliefRow:
+    """Stands in for the {target name: value} row of a BeliefOverlay."""
+
+    def __init__(self, overlay, i):
+        self.overlay = overlay
+        self.i = i
+
+    def _cell(self, name):
+        return self.overlay.cell(self.i, self.overlay.store.index[name])
+
+    def __getitem__(self, name):
+        delta = self.overlay.block[self._cell(name)]
+        if delta == 0:
+            raise KeyError(name)
+        j = self.overlay.store.index[name]
+        return float(self.overlay.base_values[self.i, j] + delta)
+
+    def __setitem__(self, name, value):
+        base_value = self.overlay.base_values[self.i, self.overlay.store.index[name]]
+        if not np.isfinite(base_value):
+            raise ValueError(f"There is no relationship towards {name} to hold beliefs")
+        self.overlay.block[self._cell(name)] = value - base_value
+
+    def __delitem__(self, name):
+        self.overlay.block[self._cell(name)] = 0
+
+    def __contains__(self, name):
+        return (
+            name in self.overlay.store.index
+            and self.overlay.block[self._cell(name)] != 0
+        )
+
+    def keys(self):
+        names = self.overlay.store.names
+        return [names[j] for j in np.flatnonzero(self.overlay.row(self.i)).tolist()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return int(np.count_nonzero(self.overlay.row(self.i)))
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
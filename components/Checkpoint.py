@@ -0,0 +1,419 @@
+import importlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from components.Contestant import Contestant
+from components.EstimatedSocialNetwork import (EstimatedSocialNetwork,
+                                               FrozenSocialNetwork)
+from components.SocialNetwork import SocialNetwork
+from components.SparseTrust import SparseTrust
+from components.Topology import ExplicitTopology
+from components.TrustMatrix import TrustMatrix
+
+FORMAT_VERSION = 1
+HEADER = "header.json"
+
+
+def save_checkpoint(net, dirname, extra=None):
+    """
+    Saves the state of the true network `net`, and the estimated networks of its contestants, to
+    the directory `dirname`: one .npy file per array (trust entries as source/target index lists)
+    and a small JSON header for the contestants, their strategies and traits, the round and the
+    random generator states. `extra` is any JSON data to keep alongside, such as the progress of
+    the caller. Realized trust, caches, event logs, tracers and plots are not saved.
+    The previous checkpoint in `dirname` is only replaced once the new one is complete.
+    """
+    contestants = _all_contestants(net)
+    index = {c.name: i for i, c in enumerate(contestants)}
+    arrays = {}
+    header = {
+        "format": FORMAT_VERSION,
+        "contestants": [_contestant_state(c) for c in contestants],
+        "network": _network_state(net, index, arrays, "trust_"),
+        "estimated": None,
+        "extra": extra,
+    }
+    owners = [c for c in net.iter_contestants() if c.estimated_social_network]
+    if owners:
+        base = owners[0].estimated_social_network.base
+        header["estimated"] = {
+            "base": _network_state(base, index, arrays, "base_"),
+            "networks": _overlay_states(owners, index, arrays),
+        }
+
+    tmp_dirname = dirname + ".tmp"
+    if os.path.exists(tmp_dirname):
+        shutil.rmtree(tmp_dirname)
+    os.makedirs(tmp_dirname)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dirname, f"{name}.npy"), array)
+    # The header is written last, so a directory with a header holds a complete checkpoint
+    with open(os.path.join(tmp_dirname, HEADER), "w") as f:
+        json.dump(header, f)
+    if os.path.exists(dirname):
+        shutil.rmtree(dirname)
+    os.replace(tmp_dirname, dirname)
+
+
+def checkpoint_exists(dirname):
+    return _checkpoint_dirname(dirname) is not None
+
+
+def open_checkpoint(dirname):
+    """
+    Opens a checkpoint without rebuilding the game: returns (header, {name: array}), where the
+    arrays are memory-mapped read-only, so nothing is read until it is used.
+    Trust arrays come in groups sharing a prefix ("trust_" for the true network, "base_" for the
+    base of the estimated networks): [prefix]source/target index into header["contestants"],
+    [prefix]mean/var are the trust of source towards target and [prefix]active marks the
+    contestants still in the network. Overlay entries of the estimated networks are in
+    "overlay_*" (field 0 for trust_mean, 1 for trust_var) and their evictions in "removed_*".
+    """
+    resolved = _checkpoint_dirname(dirname)
+    if resolved is None:
+        raise FileNotFoundError(f"There is no checkpoint in {dirname}")
+    with open(os.path.join(resolved, HEADER)) as f:
+        header = json.load(f)
+    if header["format"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint format {header['format']}")
+    arrays = {
+        name[: -len(".npy")]: np.load(os.path.join(resolved, name), mmap_mode="r")
+        for name in os.listdir(resolved)
+        if name.endswith(".npy")
+    }
+    return header, arrays
+
+
+def load_checkpoint(dirname):
+    """
+    Rebuilds the game saved by save_checkpoint.
+    A network with a topology comes back with an ExplicitTopology of its saved relationships.
+    :return: (true network, extra data given to save_checkpoint)
+    """
+    header, arrays = open_checkpoint(dirname)
+    contestants = [_make_contestant(state) for state in header["contestants"]]
+    net = _restore_network(header["network"], contestants, arrays, "trust_")
+    estimated = header["estimated"]
+    if estimated is not None:
+        if estimated["base"].get("frozen"):
+            base = _restore_frozen_network(estimated["base"], net, contestants, arrays)
+        else:
+            base_contestants = [
+                _make_contestant(state) for state in header["contestants"]
+            ]
+            base = _restore_network(
+                estimated["base"], base_contestants, arrays, "base_"
+            )
+        _restore_overlays(estimated["networks"], base, contestants, arrays)
+    return net, header["extra"]
+
+
+def _all_contestants(net):
+    """Every contestant who joined the game, in join order, evicted ones included."""
+    contestants = []
+    for network in (net, _base_of(net)):
+        if network is None:
+            continue
+        if network.trust_matrix is not None:
+            contestants.extend(network.trust_matrix.contestants)
+        else:
+            contestants.extend(network.iter_contestants())
+    unique = {}
+    for c in contestants:
+        unique.setdefault(c.name, c)
+    return list(unique.values())
+
+
+def _base_of(net):
+    for c in net.iter_contestants():
+        if c.estimated_social_network is not None:
+            return c.estimated_social_network.base
+    return None
+
+
+def _network_state(net, index, arrays, prefix):
+    if net.trust_matrix is None:
+        storage = "dict"
+    elif net.topology is not None:
+        storage = "sparse"
+    else:
+        storage = "dense"
+    sources, targets, trust_mean, trust_var = _trust_entries(net, index)
+    arrays[prefix + "source"] = sources
+    arrays[prefix + "target"] = targets
+    arrays[prefix + "mean"] = trust_mean
+    arrays[prefix + "var"] = trust_var
+    active = np.zeros(len(index), dtype=bool)
+    active[[index[c.name] for c in net.iter_contestants()]] = True
+    arrays[prefix + "active"] = active
+    return {
+        "storage": storage,
+        "frozen": isinstance(net, FrozenSocialNetwork),
+        "n_interactions": net.n_interactions,
+        "gossip_rate": net.gossip_rate,
+        "gossip_temperature": net.gossip_temperature,
+        "interaction_handler": _object_state(net.interaction_handler),
+        "verbose": net.verbose,
+        "mc_cache_size": net.mc_cache.maxsize,
+        "split": net.split,
+        "current_round": net.current_round,
+        "available_names": net.available_names,
+        **_random_state(net),
+    }
+
+
+def _trust_entries(net, index):
+    """(sources, targets, trust_mean, trust_var) of every directed relationship of `net`."""
+    trust_matrix = net.trust_matrix
+    if trust_matrix is None:
+        entries = [
+            (a, b, rel_link.trust_mean[a.name], rel_link.trust_var[a.name])
+            for u, v, data in net.graph.edges(data=True)
+            for rel_link in (data["relationship"],)
+            for a, b in ((u, v), (v, u))
+        ]
+        return (
+            np.array([index[a.name] for a, _, _, _ in entries], dtype=np.int32),
+            np.array([index[b.name] for _, b, _, _ in entries], dtype=np.int32),
+            np.array([m for _, _, m, _ in entries], dtype=float),
+            np.array([v for _, _, _, v in entries], dtype=float),
+        )
+    ids = np.array([index[c.name] for c in trust_matrix.contestants], dtype=np.int32)
+    if net.topology is not None:
+        n = trust_matrix.n_entries
+        return (
+            ids[trust_matrix.source[:n]],
+            ids[trust_matrix.target[:n]],
+            trust_matrix.trust_mean[:n].copy(),
+            trust_matrix.trust_var[:n].copy(),
+        )
+    # Dense trust is kept between every pair of contestants, evicted ones included
+    n = trust_matrix.size
+    sources, targets = np.nonzero(~np.eye(n, dtype=bool))
+    return (
+        ids[sources],
+        ids[targets],
+        trust_matrix.trust_mean[sources, targets],
+        trust_matrix.trust_var[sources, targets],
+    )
+
+
+def _overlay_states(owners, index, arrays):
+    networks = []
+    overlay = {"owner": [], "field": [], "source": [], "target": [], "value": []}
+    removed = {"owner": [], "contestant": []}
+    for owner in owners:
+        estimated = owner.estimated_social_network
+        owner_i = index[owner.name]
+        for field_i, field in enumerate(("trust_mean", "trust_var")):
+            for a_name, row in getattr(estimated, field).items():
+                for b_name, value in row.items():
+                    overlay["owner"].append(owner_i)
+                    overlay["field"].append(field_i)
+                    overlay["source"].append(index[a_name])
+                    overlay["target"].append(index[b_name])
+                    overlay["value"].append(value)
+        for name in estimated.removed:
+            removed["owner"].append(owner_i)
+            removed["contestant"].append(index[name])
+        networks.append(
+            {
+                "owner": owner_i,
+                "current_round": estimated.current_round,
+                "split": estimated.split,
+                **_random_state(estimated),
+            }
+        )
+    for key, values in overlay.items():
+        arrays["overlay_" + key] = np.array(
+            values, dtype=float if key == "value" else np.int32
+        )
+    for key, values in removed.items():
+        arrays["removed_" + key] = np.array(values, dtype=np.int32)
+    return networks
+
+
+def _random_state(net):
+    return {
+        "seed_entropy": net.seed_sequence.entropy,
+        "seed_spawn_key": list(net.seed_sequence.spawn_key),
+        "rng": net.rng.bit_generator.state,
+        "n_mc_calls": net.n_mc_calls,
+        "n_spawned": net.n_spawned,
+    }
+
+
+def _set_random_state(net, state):
+    net.seed_sequence = np.random.SeedSequence(
+        state["seed_entropy"], spawn_key=tuple(state["seed_spawn_key"])
+    )
+    net.rng = np.random.default_rng(net.seed_sequence)
+    net.rng.bit_generator.state = state["rng"]
+    net.n_mc_calls = state["n_mc_calls"]
+    net.n_spawned = state["n_spawned"]
+
+
+def _restore_network(state, contestants, arrays, prefix):
+    sources = np.asarray(arrays[prefix + "source"])
+    targets = np.asarray(arrays[prefix + "target"])
+    topology = None
+    if state["storage"] == "sparse":
+        names = [c.name for c in contestants]
+        topology = ExplicitTopology(
+            [(names[a], names[b]) for a, b in zip(sources.tolist(), targets.tolist())]
+        )
+    net = SocialNetwork(
+        n_interactions=state["n_interactions"],
+        gossip_rate=state["gossip_rate"],
+        gossip_temperature=state["gossip_temperature"],
+        interaction_handler=_make_object(state["interaction_handler"]),
+        dense_trust=state["storage"] == "dense",
+        verbose=state["verbose"],
+        mc_cache_size=state["mc_cache_size"],
+        topology=topology,
+    )
+    for c in contestants:
+        net.add_contestant(c)
+    trust_mean, trust_var = arrays[prefix + "mean"], arrays[prefix + "var"]
+    if state["storage"] == "dense":
+        # Contestants were added in the saved order, so their ids are their indices
+        net.trust_matrix.trust_mean[sources, targets] = trust_mean
+        net.trust_matrix.trust_var[sources, targets] = trust_var
+    else:
+        for a, b, mean, var in zip(
+            sources.tolist(), targets.tolist(), trust_mean.tolist(), trust_var.tolist()
+        ):
+            rel_link = net.get_relationship(contestants[a], contestants[b])
+            rel_link.trust_mean[contestants[a].name] = mean
+            rel_link.trust_var[contestants[a].name] = var
+    for c, active in zip(contestants, arrays[prefix + "active"].tolist()):
+        if not active:
+            net.remove_contestant(c)
+    net.split = state["split"]
+    net.current_round = state["current_round"]
+    net.available_names = state["available_names"]
+    _set_random_state(net, state)
+    return net
+
+
+def _restore_frozen_network(state, net, contestants, arrays):
+    """
+    Restores the FrozenSocialNetwork base of the estimated networks, which shares the contestants,
+    interaction handler and topology of the true network `net` like the one it was saved from.
+    """
+    sources = np.asarray(arrays["base_source"])
+    targets = np.asarray(arrays["base_target"])
+    if state["storage"] == "sparse":
+        trust_matrix = SparseTrust()
+    else:
+        trust_matrix = TrustMatrix(capacity=max(1, len(contestants)))
+    for c in contestants:
+        trust_matrix.add(c)
+    if state["storage"] == "sparse":
+        # Both directions of a relationship are saved, and linking adds both
+        for a, b in zip(sources.tolist(), targets.tolist()):
+            if a < b:
+                trust_matrix.link(contestants[a], contestants[b])
+        entries = np.array(
+            [
+                trust_matrix.cell(contestants[a].name, contestants[b].name)
+                for a, b in zip(sources.tolist(), targets.tolist())
+            ],
+            dtype=int,
+        )
+    else:
+        # Contestants were added in the saved order, so their ids are their indices
+        entries = (sources, targets)
+    trust_matrix.trust_mean[entries] = arrays["base_mean"]
+    trust_matrix.trust_var[entries] = arrays["base_var"]
+    for c, active in zip(contestants, arrays["base_active"].tolist()):
+        if not active:
+            trust_matrix.remove(c)
+    base = FrozenSocialNetwork(net, trust_matrix)
+    base.n_interactions = state["n_interactions"]
+    base.gossip_rate = state["gossip_rate"]
+    base.gossip_temperature = state["gossip_temperature"]
+    base.verbose = state["verbose"]
+    base.split = state["split"]
+    base.current_round = state["current_round"]
+    base.available_names = state["available_names"]
+    _set_random_state(base, state)
+    return base
+
+
+def _restore_overlays(networks, base, contestants, arrays):
+    # Overlays take their random streams from the checkpoint, not from the base
+    n_spawned = base.n_spawned
+    overlays = {}
+    for state in networks:
+        estimated = EstimatedSocialNetwork(base)
+        estimated.current_round = state["current_round"]
+        estimated.split = state["split"]
+        _set_random_state(estimated, state)
+        contestants[state["owner"]].estimated_social_network = estimated
+        overlays[state["owner"]] = estimated
+    names = [c.name for c in contestants]
+    fields = ("trust_mean", "trust_var")
+    for owner, field, source, target, value in zip(
+        *(
+            arrays["overlay_" + key].tolist()
+            for key in ("owner", "field", "source", "target", "value")
+        )
+    ):
+        overlay = getattr(overlays[owner], fields[field])
+        overlay.setdefault(names[source], {})[names[target]] = value
+    for owner, removed in zip(
+        arrays["removed_owner"].tolist(), arrays["removed_contestant"].tolist()
+    ):
+        overlays[owner].removed.add(names[removed])
+    base.n_spawned = n_spawned
+
+
+def _contestant_state(c):
+    return {
+        "name": c.name,
+        "voting_strategy": _object_state(c.voting_strategy),
+        "interaction_strategy": _object_state(c.interaction_strategy),
+        "immutable_traits": _object_state(c.immutable_traits),
+        "mutable_traits": _object_state(c.mutable_traits),
+    }
+
+
+def _make_contestant(state):
+    return Contestant(
+        name=state["name"],
+        voting_strategy=_make_object(state["voting_strategy"]),
+        interaction_strategy=_make_object(state["interaction_strategy"]),
+        immutable_traits=_make_object(state["immutable_traits"]),
+        mutable_traits=_make_object(state["mutable_traits"]),
+    )
+
+
+def _object_state(obj):
+    """Class and attributes of a strategy, handler or traits object, whose attributes must be JSON."""
+    return {
+        "class": f"{type(obj).__module__}:{type(obj).__qualname__}",
+        "attributes": vars(obj),
+    }
+
+
+def _make_object(state):
+    module_name, _, class_name = state["class"].partition(":")
+    cls = getattr(importlib.import_module(module_name), class_name)
+    obj = cls.__new__(cls)
+    obj.__dict__.update(state["attributes"])
+    return obj
+
+
+def _checkpoint_dirname(dirname):
+    """
+    The directory holding the latest complete checkpoint: `dirname`, or its temporary directory if
+    saving was interrupted after the old checkpoint was removed.
+    """
+    for candidate in (dirname, dirname + ".tmp"):
+        if os.path.exists(os.path.join(candidate, HEADER)):
+            return candidate
+    return None
@@ -1,10 +1,15 @@
 import random
 import string
-from copy import deepcopy
+from contextlib import nullcontext
 
+import numpy as np
+
+from components import Analytic, MonteCarlo
+from components.EstimatedSocialNetwork import EstimatedSocialNetwork
 from components.InteractionStrategies import InteractionStrategy
 from components.Signals import SplitSignal
 from components.SocialNetwork import SocialNetwork
+from components.Tracer import traced
 from components.Traits import ImmutableTraits, MutableTraits
 from components.VotingStrategies import VotingStrategy
 
@@ -25,71 +30,267 @@ class Contestant:
         self.immutable_traits = immutable_traits
         self.mutable_traits = mutable_traits
         self.estimated_social_network = None
-        self.immune_from_votes = False
+        # Games kept by MC_simulate_games(reuse=True)
+        self.mc_samples = None
 
     def generate_estimated_social_network(self, true_network):
         if self.estimated_social_network is not None:
             raise Exception(
                 "Trying to generate an estimated social network where one already exists."
             )
+        tracer = true_network.tracer
+        with (
+            nullcontext()
+            if tracer is None
+            else tracer.span("generate_estimated_social_network")
+        ):
+            self._init_estimated_social_network(true_network)
+
+    def _init_estimated_social_network(self, true_network):
         self.estimated_social_network = self._generate_estimated_social_network(
             true_network
         )
-        for neighbour, data in self.estimated_social_network.graph[self].items():
-            data["relationship"].trust_var[neighbour.name] = 100
-        for c in self.estimated_social_network.iter_contestants():
-            c.estimated_social_network = self.estimated_social_network
+        # Nobody knows how much their neighbours trust them
+        estimated = self.estimated_social_network
+        neighbours = estimated.neighbours(self)
+        pairs = [(neighbour.name, self.name) for neighbour in neighbours]
+        base_values = np.array(
+            [estimated.base_trust("trust_var", *pair) for pair in pairs]
+        )
+        estimated.update_trust(
+            "trust_var", pairs, np.full(len(pairs), 100.0), base_values
+        )
+
+    def MC_simulate_games(
+        self,
+        n=100,
+        batched=False,
+        use_cache=True,
+        incremental=False,
+        analytic=False,
+        reuse=False,
+        ess_threshold=0.5,
+        rng=None,
+    ):
+        """
+        Will run `n` simulations of the game, based on the estimated social network of the contestant.
+        With batched=True all games are simulated at once with array ops, when every voter's
+        strategy supports it.
+        With incremental=True, trust is sampled once per game instead of before every vote, and
+        votes are updated incrementally as contestants become immune (see
+        MonteCarlo.simulate_game_incremental). This needs every voter to support the batched engine.
+        With analytic=True, nothing is sampled: the distribution of the next vote (round 1 only) is
+        computed by numerical integration, see Analytic.next_vote_distribution. `n` is ignored.
+        This also needs every voter to support the batched engine.
+        With reuse=True, games are played as with incremental=True but kept from one call to
+        the next, and reweighted to the current estimated social network instead of sampled again
+        until their effective sample size drops below ess_threshold * n (see
+        MonteCarlo.MC_simulate_reweighted). Kept games are not saved in checkpoints.
+        With use_cache, the result is reused while the estimated social network is unchanged.
+        Random numbers are drawn from `rng`, by default the random stream of the estimated social
+        network. Results are not cached when an `rng` is given.
+        """
+        if (incremental or reuse) and not MonteCarlo.batch_supported(
+            self.estimated_social_network
+        ):
+            raise ValueError(
+                "Incremental MC simulation needs every voter to support the batched engine"
+            )
+        if analytic:
+            if not MonteCarlo.batch_supported(self.estimated_social_network):
+                raise ValueError(
+                    "Analytic vote distributions need every voter to support the batched engine"
+                )
+            if use_cache:
+                return self.estimated_social_network.cached_MC(
+                    ("next_vote_distribution",),
+                    lambda: self._next_vote_distribution(),
+                )
+            return self._next_vote_distribution()
+        if reuse:
+            if use_cache:
+                return self.estimated_social_network.cached_MC(
+                    ("MC_simulate_reweighted", n, ess_threshold),
+                    lambda: self._MC_simulate_reweighted(n, ess_threshold),
+                )
+            return self._MC_simulate_reweighted(n, ess_threshold)
+        if use_cache and rng is None:
+            return self.estimated_social_network.cached_MC(
+                ("MC_simulate_games", n, batched, incremental),
+                lambda: self._MC_simulate_games(n, batched, incremental),
+            )
+        return self._MC_simulate_games(n, batched, incremental, rng)
+
+    @traced("next_vote_distribution")
+    def _next_vote_distribution(self):
+        return Analytic.next_vote_distribution(self.estimated_social_network)
 
-    def MC_simulate_games(self, n=100):
-        """Will run `n` simulations of the game, based on the estimated social network of the contestant"""
+    @traced("MC_simulate_reweighted")
+    def _MC_simulate_reweighted(self, n, ess_threshold):
+        result, self.mc_samples = MonteCarlo.MC_simulate_reweighted(
+            self.estimated_social_network, n, self.mc_samples, ess_threshold
+        )
+        return result
+
+    @traced("MC_simulate_games")
+    def _MC_simulate_games(self, n, batched, incremental=False, rng=None):
+        if incremental:
+            return MonteCarlo.MC_simulate_games(
+                self.estimated_social_network, n, rng=rng, incremental=True
+            )
+        if batched and MonteCarlo.batch_supported(self.estimated_social_network):
+            return MonteCarlo.MC_simulate_games(
+                self.estimated_social_network, n, rng=rng
+            )
         results = []
+        # Contestants voted out in a simulated game become immune in the estimated social
+        # network only, as its contestant objects are shared with the true network
+        estimated = self.estimated_social_network
+        # Votes and trust are drawn from the random stream of the network, so `rng` stands in
+        # for it during the simulation
+        own_rng = estimated.rng
+        if rng is not None:
+            estimated.rng = rng
         for i in range(n):
             result = []
-            self.estimated_social_network.sample_trust()
-            for c in self.estimated_social_network.iter_contestants():
-                c.immune_from_votes = False
+            estimated.sample_trust()
+            estimated.immune = set()
             while True:
-                c, _ = self.estimated_social_network.simulate_vote()
+                c, _ = estimated.simulate_vote()
                 result.append(c)
                 if c == SplitSignal:
                     results.append(result)
                     break
-                c.immune_from_votes = True
-        self.estimated_social_network.clear_realized_trust()
-        for c in self.estimated_social_network.iter_contestants():
-            c.immune_from_votes = False
+                estimated.immune.add(c.name)
+        estimated.clear_realized_trust()
+        estimated.immune = set()
+        estimated.rng = own_rng
+        return self._games_distribution(results)
+
+    async def MC_simulate_games_async(
+        self, n=100, use_cache=True, rng=None, timeout=None
+    ):
+        """
+        MC_simulate_games for estimated social networks whose voters wait on agent backends: every
+        simulated vote is collected with SocialNetwork.collect_votes_async, so all simulated voters
+        are queried at once, in the same batches as the other simulations running on the event
+        loop (see SocialNetwork.MC_simulate_all_async). A simulated voter who does not answer
+        within `timeout` seconds splits.
+        Estimated social networks which support the batched engine are simulated as in
+        MC_simulate_games. Results are cached like those of MC_simulate_games.
+        """
+        estimated = self.estimated_social_network
+        if MonteCarlo.batch_supported(estimated):
+            return self.MC_simulate_games(n, use_cache=use_cache, rng=rng)
+        use_cache = use_cache and rng is None
+        key = (estimated.state_fingerprint(), ("MC_simulate_games", n, False, False))
+        result = estimated.mc_cache.get(key) if use_cache else None
+        if result is None:
+            result = await self._MC_simulate_games_async(n, rng, timeout)
+            if use_cache:
+                estimated.mc_cache.put(key, result)
+        return result
+
+    async def _MC_simulate_games_async(self, n, rng, timeout):
+        results = []
+        estimated = self.estimated_social_network
+        own_rng = estimated.rng
+        if rng is not None:
+            estimated.rng = rng
+        for i in range(n):
+            result = []
+            estimated.sample_trust()
+            estimated.immune = set()
+            while True:
+                c, _ = estimated.count_votes(
+                    await estimated.collect_votes_async(timeout)
+                )
+                result.append(c)
+                if c == SplitSignal:
+                    results.append(result)
+                    break
+                estimated.immune.add(c.name)
+        estimated.clear_realized_trust()
+        estimated.immune = set()
+        estimated.rng = own_rng
+        return self._games_distribution(results)
+
+    def _games_distribution(self, results):
+        """{round: {evicted contestant or SplitSignal: frequency}} of simulated games."""
         result_dict = {}
         for i in range(1, 1 + len(self.estimated_social_network.get_all_contestants())):
             g_r = [r[i - 1] for r in results if len(r) >= i]
             result_dict[i] = {x: g_r.count(x) / len(g_r) for x in set(g_r)}
         return result_dict
 
-    def get_true_trust(self):
-        """Returns an array of neighbours-perceived_trust of a constestant."""
-        trust_neighbours = {}
-        for neighbour, data in self.estimated_social_network.graph[self].items():
-            if data["relationship"].trust_var[self.name] == 0:
-                trust_neighbours[neighbour] = data["relationship"].trust_mean[self.name]
-            else:
-                r_t = data["relationship"].realized_trust[self.name]
-                assert (
-                    r_t is not None
-                ), "If trust variance > 0, realized trust must exist"
-                trust_neighbours[neighbour] = r_t
-        return trust_neighbours
-
-    def get_vote(self):
-        return self.voting_strategy.choose(self)
+    def MC_simulate_adaptive(
+        self, ci_width=0.05, max_trials=10000, max_time=None, **kwargs
+    ):
+        """
+        Simulates games in batches until the eviction probabilities of each round are within
+        confidence intervals of width `ci_width`, or the trial/time budget is used up.
+        See MonteCarlo.MC_simulate_adaptive for the other options. Results are cached like
+        MC_simulate_games, unless an `rng` is given.
+        :return: (distribution, error bars, number of trials)
+        """
+        if not MonteCarlo.batch_supported(self.estimated_social_network):
+            raise ValueError(
+                "Adaptive MC simulation needs every voter to support the batched engine"
+            )
+        if "rng" in kwargs:
+            return self._MC_simulate_adaptive(ci_width, max_trials, max_time, **kwargs)
+        query = ("MC_simulate_adaptive", ci_width, max_trials, max_time) + tuple(
+            sorted(kwargs.items())
+        )
+        return self.estimated_social_network.cached_MC(
+            query,
+            lambda: self._MC_simulate_adaptive(
+                ci_width, max_trials, max_time, **kwargs
+            ),
+        )
+
+    @traced("MC_simulate_adaptive")
+    def _MC_simulate_adaptive(self, ci_width, max_trials, max_time, **kwargs):
+        return MonteCarlo.MC_simulate_adaptive(
+            self.estimated_social_network,
+            ci_width=ci_width,
+            max_trials=max_trials,
+            max_time=max_time,
+            **kwargs,
+        )
+
+    @property
+    def tracer(self):
+        """Tracer of the contestant's estimated social network, if any."""
+        net = self.estimated_social_network
+        return None if net is None else net.tracer
+
+    def get_true_trust(self, net=None):
+        """
+        Returns a dict of neighbours-perceived_trust of a constestant, according to `net`
+        (by default the contestant's estimated social network).
+        """
+        net = self.estimated_social_network if net is None else net
+        return net.true_trust(self)
+
+    def get_vote(self, net=None):
+        return self.voting_strategy.choose(self, net)
 
     def get_interaction(self, true_net):
         return self.interaction_strategy.choose(true_net, self)
 
+    async def get_vote_async(self, net=None):
+        return await self.voting_strategy.choose_async(self, net)
+
+    async def get_interaction_async(self, true_net):
+        return await self.interaction_strategy.choose_async(true_net, self)
+
     def _generate_random_name(self, length=6):
         # Fallback method in case no name is provided.
         return "".join(random.choices(string.ascii_uppercase, k=length))
 
     def _generate_estimated_social_network(self, true_network: SocialNetwork):
-        return deepcopy(true_network)
+        return EstimatedSocialNetwork(true_network)
 
     def __hash__(self):
         return hash(self.name)
@@ -0,0 +1,255 @@
+import numpy as np
+
+from components.MonteCarlo import MAX_CHUNK_ENTRIES
+
+METRICS = ("mean_error", "kl", "rank_agreement", "eviction_agreement")
+
+
+def divergence(net, min_sigma=0.1):
+    """
+    Measures how different every contestant's estimated social network is from the true network
+    `net`, over the directed relationships between the contestants still in the game:
+    - mean_error: mean absolute difference between believed and true mean trust,
+    - kl: mean KL divergence from the true Gaussian trust to the believed one, with sigmas
+      (trust_var) floored at `min_sigma` so that certain trust has a finite divergence,
+    - rank_agreement: Spearman correlation between the votes each contestant would receive if
+      everyone voted for whoever they trust least in the true network, and under the beliefs
+      (NaN when either gives everyone the same number of votes),
+    - eviction_agreement: 1 if the beliefs predict the same most voted contestant, else 0.
+    All contestants are measured in one vectorized pass over the trust entries of the
+    relationships (see SocialNetwork.trust_entries): the shared base is compared once, and the
+    overlay entries of every estimated network are gathered into flat arrays of corrections.
+    No random numbers are drawn, so measuring does not change the game.
+    :return: (contestants, {metric: (N,) array with one value per contestant})
+    """
+    contestants, sources, targets, true_mean, true_var = net.trust_entries()
+    names = [c.name for c in contestants]
+    n = len(contestants)
+    n_entries = len(sources)
+    indptr = np.searchsorted(sources, np.arange(n + 1))
+    # Entries are sorted by source and then target, so their keys are sorted too
+    keys = sources * n + targets
+    n_edges = max(1, n_entries)
+    true_votes = _votes(indptr, targets, true_mean)
+    true_counts = np.bincount(true_votes[true_votes >= 0], minlength=n)
+
+    # Beliefs of the base of each estimated network (usually all share one), stacked
+    networks = [c.estimated_social_network for c in contestants]
+    bases = {}
+    for estimated in networks:
+        bases.setdefault(id(estimated.base), estimated)
+    of_base = np.array([list(bases).index(id(e.base)) for e in networks], dtype=int)
+    states = [
+        _base_state(estimated, names, sources, targets, true_mean, true_var, min_sigma)
+        for estimated in bases.values()
+    ]
+    base_mean, base_var, base_error, base_kl = (
+        np.stack([state[i] for state in states]) for i in range(4)
+    )
+    # Position of each base contestant among the contestants still in the game (-1 if evicted)
+    base_positions = np.full((len(states), max(len(s[4]) for s in states)), -1)
+    for g, state in enumerate(states):
+        base_positions[g, : len(state[4])] = state[4]
+
+    # Overlay entries of relationships between contestants still in the game, keyed on
+    # k * n_entries + e for entry e of networks[k]
+    overlay = {
+        field: _overlay_entries(networks, field, of_base, base_positions, keys, n)
+        for field in ("trust_mean", "trust_var")
+    }
+    corrected, _ = _unique_sorted(
+        np.sort(np.concatenate([overlay["trust_mean"][0], overlay["trust_var"][0]]))
+    )
+    owners, entries = np.divmod(corrected, n_edges)
+    bases_of = of_base[owners]
+    mean = base_mean[bases_of, entries]
+    var = base_var[bases_of, entries]
+    for believed, (field_keys, values) in zip(
+        (mean, var), (overlay["trust_mean"], overlay["trust_var"])
+    ):
+        believed[np.searchsorted(corrected, field_keys)] = values
+
+    # Estimated networks only differ from their base at overlay entries, so the divergence
+    # of the base is corrected there
+    error = np.abs(mean - true_mean[entries]) - base_error[bases_of, entries]
+    kl = (
+        _gaussian_kl(true_mean[entries], true_var[entries], mean, var, min_sigma)
+        - base_kl[bases_of, entries]
+    )
+    metrics = {
+        "mean_error": (
+            base_error.sum(axis=1)[of_base] + np.bincount(owners, error, minlength=n)
+        )
+        / n_edges,
+        "kl": (base_kl.sum(axis=1)[of_base] + np.bincount(owners, kl, minlength=n))
+        / n_edges,
+    }
+
+    # Votes received per contestant, under the beliefs of each contestant. Only the votes of
+    # the rows holding overlay mean entries can differ from the base
+    base_votes = np.stack([_votes(indptr, targets, mean) for mean in base_mean])
+    voted = base_votes >= 0
+    base_counts = np.bincount(
+        np.nonzero(voted)[0] * n + base_votes[voted], minlength=len(states) * n
+    ).reshape(len(states), n)
+    mean_keys, mean_values = overlay["trust_mean"]
+    mean_owners, mean_entries = np.divmod(mean_keys, n_edges)
+    owner_rows, inverse = _unique_sorted(mean_owners * n + sources[mean_entries])
+    row_owners, rows = np.divmod(owner_rows, n)
+    lengths = np.diff(indptr)[rows]
+    ends = np.cumsum(lengths)
+    row_votes = np.empty(len(owner_rows), dtype=int)
+    start = 0
+    while start < len(owner_rows):
+        stop = max(
+            start + 1,
+            np.searchsorted(
+                ends, ends[start] - lengths[start] + MAX_CHUNK_ENTRIES, "right"
+            ),
+        )
+        # The entries of the rows of the chunk, with their overlay mean entries applied
+        chunk = slice(start, stop)
+        chunk_indptr = np.concatenate([[0], np.cumsum(lengths[chunk])])
+        row_of = np.repeat(np.arange(stop - start), lengths[chunk])
+        row_entries = indptr[rows[chunk]][row_of] + (
+            np.arange(chunk_indptr[-1]) - chunk_indptr[row_of]
+        )
+        believed = base_mean[of_base[row_owners[chunk]][row_of], row_entries]
+        in_chunk = (inverse >= start) & (inverse < stop)
+        in_row = inverse[in_chunk] - start
+        believed[
+            chunk_indptr[in_row] + mean_entries[in_chunk] - indptr[rows[chunk]][in_row]
+        ] = mean_values[in_chunk]
+        row_votes[chunk] = _votes(chunk_indptr, targets[row_entries], believed)
+        start = stop
+    old_votes = base_votes[of_base[row_owners], rows]
+
+    # Vote counts are (N, N), so they are made and ranked a chunk of contestants at a time
+    metrics["rank_agreement"] = np.empty(n)
+    metrics["eviction_agreement"] = np.empty(n)
+    chunk_size = max(1, MAX_CHUNK_ENTRIES // max(1, n))
+    for start in range(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        counts = base_counts[of_base[start:stop]]
+        changed = slice(*np.searchsorted(row_owners, [start, stop]))
+        for votes, delta in ((old_votes[changed], -1), (row_votes[changed], 1)):
+            owners = row_owners[changed][votes >= 0] - start
+            np.add.at(counts, (owners, votes[votes >= 0]), delta)
+        metrics["rank_agreement"][start:stop] = _spearman(counts, true_counts[None, :])
+        metrics["eviction_agreement"][start:stop] = (
+            counts.argmax(axis=1) == true_counts.argmax()
+        )
+    return contestants, metrics
+
+
+def summary(metrics):
+    """Mean of each metric over the contestants, ignoring NaN (None if all are NaN)."""
+    return {
+        metric: float(np.nanmean(values)) if np.isfinite(values).any() else None
+        for metric, values in metrics.items()
+    }
+
+
+def _base_state(estimated, names, sources, targets, true_mean, true_var, min_sigma):
+    """
+    Beliefs of the base of `estimated` at the relationships (sources, targets) between `names`,
+    their divergence from the true network, and the position of every base contestant among
+    `names` (-1 if absent).
+    """
+    _, index, base_sources, base_targets, base_entries = estimated.base_entries()
+    ids = np.array([index[name] for name in names], dtype=int)
+    positions = np.full(len(index), -1)
+    positions[ids] = np.arange(len(ids))
+    base_keys = base_sources * len(index) + base_targets
+    keys = ids[sources] * len(index) + ids[targets]
+    at = np.searchsorted(base_keys, keys)
+    # Relationships the base does not know about have infinite mean trust, as without a topology
+    found = at < len(base_keys)
+    found[found] = base_keys[at[found]] == keys[found]
+    base_mean = np.full(len(keys), np.inf)
+    base_var = np.zeros(len(keys))
+    base_mean[found] = base_entries["trust_mean"][at[found]]
+    base_var[found] = base_entries["trust_var"][at[found]]
+    with np.errstate(invalid="ignore"):
+        base_error = np.abs(base_mean - true_mean)
+        base_kl = _gaussian_kl(true_mean, true_var, base_mean, base_var, min_sigma)
+    return base_mean, base_var, base_error, base_kl, positions
+
+
+def _overlay_entries(networks, field, of_base, base_positions, keys, n):
+    """
+    Keys (k * len(keys) + e) and values of the `field` overlay entries of networks[k], where e is
+    the entry of their relationship in `keys` (source * n + target).
+    """
+    sources, targets, values = (
+        np.concatenate(arrays)
+        for arrays in zip(*(estimated.overlay_arrays(field) for estimated in networks))
+    )
+    owners = np.repeat(
+        np.arange(len(networks)),
+        [len(estimated.overlay_arrays(field)[0]) for estimated in networks],
+    )
+    sources = base_positions[of_base[owners], sources]
+    targets = base_positions[of_base[owners], targets]
+    cells = sources * n + targets
+    entries = np.searchsorted(keys, cells)
+    keep = (sources >= 0) & (targets >= 0) & (entries < len(keys))
+    keep[keep] = keys[entries[keep]] == cells[keep]
+    overlay_keys = owners[keep] * len(keys) + entries[keep]
+    order = np.argsort(overlay_keys)
+    return overlay_keys[order], values[keep][order]
+
+
+def _unique_sorted(values):
+    """np.unique(values, return_inverse=True) for sorted values."""
+    first = np.ones(len(values), dtype=bool)
+    first[1:] = values[1:] != values[:-1]
+    return values[first], np.cumsum(first) - 1
+
+
+def _gaussian_kl(mean_p, sigma_p, mean_q, sigma_q, min_sigma):
+    """KL(N(mean_p, sigma_p^2) || N(mean_q, sigma_q^2)), elementwise."""
+    sigma_p = np.maximum(sigma_p, min_sigma)
+    sigma_q = np.maximum(sigma_q, min_sigma)
+    return (
+        np.log(sigma_q / sigma_p)
+        + (sigma_p**2 + (mean_p - mean_q) ** 2) / (2 * sigma_q**2)
+        - 0.5
+    )
+
+
+def _votes(indptr, targets, trust_mean):
+    """
+    Least trusted target of each row of entries (lowest index on ties), -1 if the row is empty.
+    The entries of row i are indptr[i]:indptr[i + 1], sorted by target.
+    """
+    lengths = np.diff(indptr)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    order = np.lexsort((targets, trust_mean, rows))
+    votes = np.full(len(lengths), -1)
+    votes[lengths > 0] = targets[order[indptr[:-1][lengths > 0]]]
+    return votes
+
+
+def _spearman(counts, true_counts):
+    """Row-wise Spearman correlation between vote counts, with tied counts sharing their mean rank."""
+    ranks, true_ranks = _mean_ranks(counts), _mean_ranks(true_counts)
+    ranks = ranks - ranks.mean(axis=1, keepdims=True)
+    true_ranks = true_ranks - true_ranks.mean(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (ranks * true_ranks).sum(axis=1) / np.sqrt(
+            (ranks**2).sum(axis=1) * (true_ranks**2).sum(axis=1)
+        )
+
+
+def _mean_ranks(counts):
+    """Ranks (from 1) of non-negative integer counts along each row, ties getting their mean rank."""
+    n_rows, n = counts.shape
+    n_values = counts.max(initial=0) + 1
+    histogram = np.bincount(
+        (np.arange(n_rows)[:, None] * n_values + counts).ravel(),
+        minlength=n_rows * n_values,
+    ).reshape(n_rows, n_values)
+    below = np.cumsum(histogram, axis=1) - histogram
+    rows = np.arange(n_rows)[:, None]
+    return below[rows, counts] + (histogram[rows, counts] + 1) / 2
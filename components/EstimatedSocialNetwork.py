@@ -0,0 +1,450 @@
+from copy import deepcopy
+
+import networkx as nx
+import numpy as np
+
+from components.SocialNetwork import SocialNetwork
+from components.Tracer import traced
+from components.TrustMatrix import TrustMatrix
+
+
+class EstimatedSocialNetwork(SocialNetwork):
+    """
+    A contestant's belief about the game, stored as a copy-on-write overlay on a shared base network.
+    The base (and its contestant objects) is shared by all estimated networks and must not be
+    modified once overlays exist; each overlay only stores the trust entries where its beliefs
+    differ from the base, and the contestants it has seen evicted.
+    """
+
+    def __init__(self, base: SocialNetwork):
+        super().__init__(
+            n_interactions=base.n_interactions,
+            interaction_handler=base.interaction_handler,
+            verbose=False,
+            mc_cache_size=base.mc_cache.maxsize,
+            tracer=base.tracer,
+            gossip_rate=base.gossip_rate,
+            gossip_temperature=base.gossip_temperature,
+        )
+        self.topology = base.topology
+        self.current_round = base.current_round
+        self.base = base
+        self.removed = set()
+        # Live view of the contestants of the base which are still in this network
+        self.graph = nx.subgraph_view(base.graph, filter_node=self._in_network)
+        # Overlay entries, as {source name: {target name: value}}, or views of a block of the
+        # BeliefStore of the base when it has one
+        self.belief_store = base.belief_store
+        if self.belief_store is None:
+            self.trust_mean = {}
+            self.trust_var = {}
+        else:
+            block = self.belief_store.allocate()
+            _, _, base_arrays = _base_arrays(base)
+            for field in ("trust_mean", "trust_var"):
+                setattr(
+                    self,
+                    field,
+                    self.belief_store.overlay(block, field, base_arrays[field]),
+                )
+        # field -> overlay entries as arrays, see overlay_arrays
+        self._overlay_arrays = {}
+        # Realized trust only exists between sample_trust and clear_realized_trust
+        self.realized_trust = None
+        # Each estimated network has its own random stream, spawned from the base
+        self.seed_sequence = base.spawn_seed_sequence()
+        self.rng = np.random.default_rng(self.seed_sequence)
+
+    def belief_network(self, contestant):
+        """Inside an estimated network, everyone votes according to the beliefs of this network."""
+        return self
+
+    def __getstate__(self):
+        # The graph view is rebuilt from the base on first use, see __getattr__
+        state = super().__getstate__()
+        del state["graph"]
+        return state
+
+    def __getattr__(self, name):
+        if name != "graph" or "base" not in self.__dict__:
+            raise AttributeError(name)
+        self.graph = nx.subgraph_view(self.base.graph, filter_node=self._in_network)
+        return self.graph
+
+    def _in_network(self, contestant):
+        return contestant.name not in self.removed
+
+    def iter_contestants(self):
+        return (c for c in self.base.iter_contestants() if c.name not in self.removed)
+
+    def get_all_contestants(self):
+        return list(self.iter_contestants())
+
+    def neighbours(self, contestant):
+        return [
+            c for c in self.base.neighbours(contestant) if c.name not in self.removed
+        ]
+
+    def add_contestant(self, contestant):
+        raise TypeError(
+            "Contestants can only be added to the base of an estimated social network."
+        )
+
+    def remove_contestant(self, contestant):
+        if contestant.name in self.removed or not self.base.graph.has_node(contestant):
+            raise ValueError(f"WARNING: There is no contestant {contestant}")
+        self.removed.add(contestant.name)
+        self.version += 1
+
+    def get_relationship(self, a, b):
+        return OverlayRelationshipLink(self, a, b)
+
+    def get_trust(self, field, a_name, b_name):
+        """Returns trust_mean/trust_var of a towards b, from the overlay if present, else from the base."""
+        overlay = getattr(self, field)
+        if a_name in overlay and b_name in overlay[a_name]:
+            return overlay[a_name][b_name]
+        return _base_trust(self.base, field, a_name, b_name)
+
+    def set_trust(self, field, a_name, b_name, value):
+        """Stores trust_mean/trust_var of a towards b, keeping only entries which differ from the base."""
+        overlay = getattr(self, field)
+        self.version += 1
+        self._overlay_arrays.pop(field, None)
+        if value != _base_trust(self.base, field, a_name, b_name):
+            overlay.setdefault(a_name, {})[b_name] = value
+        elif b_name in overlay.get(a_name, {}):
+            del overlay[a_name][b_name]
+
+    def update_trust(self, field, pairs, values, base_values):
+        """
+        set_trust for many entries at once: `pairs` are (a name, b name), and `base_values` their
+        values in the base, so that entries equal to the base are dropped from the overlay.
+        """
+        overlay = getattr(self, field)
+        changed = values != base_values
+        for (a_name, b_name), value, differs in zip(
+            pairs, values.tolist(), changed.tolist()
+        ):
+            if differs:
+                overlay.setdefault(a_name, {})[b_name] = value
+            elif b_name in overlay.get(a_name, {}):
+                del overlay[a_name][b_name]
+        self.version += 1
+        self._overlay_arrays.pop(field, None)
+
+    def base_trust(self, field, a_name, b_name):
+        """Returns trust_mean/trust_var of a towards b in the base."""
+        return _base_trust(self.base, field, a_name, b_name)
+
+    def base_arrays(self):
+        """Returns (contestants, name -> index, {"trust_mean": array, "trust_var": array}) of the base."""
+        return _base_arrays(self.base)
+
+    def base_entries(self):
+        """
+        Returns (contestants, name -> index, sources, targets, {"trust_mean": entries,
+        "trust_var": entries}) of the base, as in SocialNetwork.trust_entries.
+        """
+        return _base_entries(self.base)
+
+    def overlay_arrays(self, field):
+        """
+        Returns (sources, targets, values) arrays of the overlay entries of trust_mean/trust_var,
+        with sources and targets as indices into the contestants of the base (as in base_arrays
+        and base_entries). Cached until the overlay changes.
+        """
+        if field not in self._overlay_arrays and self.belief_store is not None:
+            self._overlay_arrays[field] = getattr(self, field).entries()
+        if field not in self._overlay_arrays:
+            _, index = _base_index(self.base)
+            sources, targets, values = [], [], []
+            for a_name, row in getattr(self, field).items():
+                for b_name, value in row.items():
+                    sources.append(index[a_name])
+                    targets.append(index[b_name])
+                    values.append(value)
+            self._overlay_arrays[field] = (
+                np.array(sources, dtype=int),
+                np.array(targets, dtype=int),
+                np.array(values, dtype=float),
+            )
+        return self._overlay_arrays[field]
+
+    def state_fingerprint(self):
+        return self.version, self.base.state_fingerprint()
+
+    def trust_arrays(self):
+        if self.topology is not None:
+            raise ValueError(
+                "A network with a topology has no dense trust arrays: use trust_entries"
+            )
+        contestants, index, base_arrays = _base_arrays(self.base)
+        members = [c for c in contestants if c.name not in self.removed]
+        ids = np.array([index[c.name] for c in members], dtype=int)
+        grid = np.ix_(ids, ids)
+        position = {c.name: i for i, c in enumerate(members)}
+        arrays = {}
+        for field in ("trust_mean", "trust_var"):
+            if self.belief_store is not None:
+                arrays[field] = getattr(self, field).dense(ids)
+                continue
+            arrays[field] = base_arrays[field][grid].copy()
+            for a_name, row in getattr(self, field).items():
+                if a_name not in position:
+                    continue
+                for b_name, value in row.items():
+                    if b_name in position:
+                        arrays[field][position[a_name], position[b_name]] = value
+        return members, arrays["trust_mean"], arrays["trust_var"]
+
+    def trust_entries(self):
+        contestants, index, sources, targets, base_entries = _base_entries(self.base)
+        members = [c for c in contestants if c.name not in self.removed]
+        positions = np.full(len(contestants), -1)
+        positions[[index[c.name] for c in members]] = np.arange(len(members))
+        keys = sources * len(contestants) + targets
+        entries = {}
+        for field in ("trust_mean", "trust_var"):
+            entries[field] = base_entries[field].copy()
+            overlay_sources, overlay_targets, values = self.overlay_arrays(field)
+            # Overlays only hold entries of relationships
+            overlay_keys = overlay_sources * len(contestants) + overlay_targets
+            entries[field][np.searchsorted(keys, overlay_keys)] = values
+        # Positions follow the order of the base, so entries stay sorted
+        sources, targets = positions[sources], positions[targets]
+        kept = (sources >= 0) & (targets >= 0)
+        return (
+            members,
+            sources[kept],
+            targets[kept],
+            entries["trust_mean"][kept],
+            entries["trust_var"][kept],
+        )
+
+    @traced("sample_trust")
+    def sample_trust(self):
+        if self.topology is not None:
+            contestants, sources, targets, trust_mean, trust_var = self.trust_entries()
+            indptr = np.searchsorted(sources, np.arange(len(contestants) + 1))
+            realized = (indptr, targets, self.rng.normal(trust_mean, trust_var))
+        else:
+            contestants, trust_mean, trust_var = self.trust_arrays()
+            realized = self.rng.normal(trust_mean, trust_var)
+        position = {c.name: i for i, c in enumerate(contestants)}
+        self.realized_trust = (position, realized)
+
+    def voting_trust(self):
+        # Trust with zero variance is sampled as its mean, so realized trust is all a vote needs
+        position, realized = self.realized_trust
+        trust = realized.copy()
+        np.fill_diagonal(trust, np.inf)
+        contestants = self.get_all_contestants()
+        assert len(contestants) == len(position), "Trust must be sampled before voting"
+        return contestants, trust
+
+    def clear_realized_trust(self):
+        self.realized_trust = None
+
+    def get_realized_trust(self, a_name, b_name):
+        if self.realized_trust is None:
+            return None
+        position, realized = self.realized_trust
+        i, j = position[a_name], position[b_name]
+        if self.topology is None:
+            return float(realized[i, j])
+        # Realized trust of the entries of a network with a topology
+        indptr, targets, values = realized
+        start = indptr[i]
+        return float(values[start + np.searchsorted(targets[start : indptr[i + 1]], j)])
+
+    def true_trust(self, contestant):
+        trust_neighbours = {}
+        for neighbour in self.neighbours(contestant):
+            if self.get_trust("trust_var", contestant.name, neighbour.name) == 0:
+                trust_neighbours[neighbour] = self.get_trust(
+                    "trust_mean", contestant.name, neighbour.name
+                )
+            else:
+                r_t = self.get_realized_trust(contestant.name, neighbour.name)
+                assert (
+                    r_t is not None
+                ), "If trust variance > 0, realized trust must exist"
+                trust_neighbours[neighbour] = r_t
+        return trust_neighbours
+
+
+class FrozenSocialNetwork(SocialNetwork):
+    """
+    Read-only snapshot of a network, to build estimated networks on. Trust is only kept in a
+    TrustMatrix (or the SparseTrust of a network with a topology), without the graph of
+    relationship objects of the original network, and the contestant objects are shared with it.
+    `trust_matrix` is the trust to use, by default a copy of that of `net`.
+    """
+
+    def __init__(self, net: SocialNetwork, trust_matrix=None):
+        super().__init__(
+            n_interactions=net.n_interactions,
+            interaction_handler=net.interaction_handler,
+            verbose=net.verbose,
+            mc_cache_size=net.mc_cache.maxsize,
+            tracer=net.tracer,
+            gossip_rate=net.gossip_rate,
+            gossip_temperature=net.gossip_temperature,
+        )
+        self.topology = net.topology
+        self.split = net.split
+        self.current_round = net.current_round
+        self.available_names = list(net.available_names)
+        # Same random streams as `net`, as a copy of it would have
+        self.seed_sequence = net.seed_sequence
+        self.rng = np.random.default_rng(self.derive_seed_sequence(0))
+        self.rng.bit_generator.state = net.rng.bit_generator.state
+        self.n_mc_calls = net.n_mc_calls
+        self.n_spawned = net.n_spawned
+
+        self.trust_matrix = (
+            _copy_trust_matrix(net) if trust_matrix is None else trust_matrix
+        )
+        # Only the contestants, relationships are read from the trust matrix
+        self.graph.add_nodes_from(
+            c
+            for c, active in zip(
+                self.trust_matrix.contestants, self.trust_matrix.active
+            )
+            if active
+        )
+
+    def neighbours(self, contestant):
+        trust_matrix = self.trust_matrix
+        i = trust_matrix.index(contestant)
+        if self.topology is None:
+            others = np.arange(trust_matrix.size)
+        else:
+            others, _ = trust_matrix.row(i)
+        others = others[trust_matrix.active[others] & (others != i)]
+        return [trust_matrix.contestants[j] for j in others.tolist()]
+
+    def add_contestant(self, contestant):
+        raise TypeError("A frozen social network cannot be modified.")
+
+    def remove_contestant(self, contestant):
+        raise TypeError("A frozen social network cannot be modified.")
+
+
+class OverlayRelationshipLink:
+    """RelationshipLink lookalike whose dicts read through to the base and write to the overlay."""
+
+    def __init__(self, net, contestant1, contestant2):
+        names = (contestant1.name, contestant2.name)
+        self.realized_trust = OverlayTrustView(net, "realized_trust", *names)
+        self.trust_mean = OverlayTrustView(net, "trust_mean", *names)
+        self.trust_var = OverlayTrustView(net, "trust_var", *names)
+
+    def __repr__(self):
+        return f"RelationshipLink(trust={self.trust_mean}, var={self.trust_var})"
+
+
+class OverlayTrustView:
+    """view[name] is the trust of `name` towards the other contestant of the edge."""
+
+    def __init__(self, net, field, name1, name2):
+        self.net = net
+        self.field = field
+        self.others = {name1: name2, name2: name1}
+
+    def __getitem__(self, name):
+        if self.field == "realized_trust":
+            return self.net.get_realized_trust(name, self.others[name])
+        return self.net.get_trust(self.field, name, self.others[name])
+
+    def __setitem__(self, name, value):
+        if self.field == "realized_trust":
+            raise TypeError(
+                "Realized trust of an estimated network is set by sample_trust"
+            )
+        self.net.set_trust(self.field, name, self.others[name], value)
+
+    def __iter__(self):
+        return iter(self.others)
+
+    def __len__(self):
+        return len(self.others)
+
+    def keys(self):
+        return self.others.keys()
+
+    def items(self):
+        return [(name, self[name]) for name in self.others]
+
+    def values(self):
+        return [self[name] for name in self.others]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def _base_trust(base, field, a_name, b_name):
+    """Trust of a towards b in the base, read in place when the base stores trust in arrays."""
+    trust_matrix = base.trust_matrix
+    if trust_matrix is not None:
+        return getattr(trust_matrix, field)[trust_matrix.cell(a_name, b_name)]
+    _, index, base_arrays = _base_arrays(base)
+    return base_arrays[field][index[a_name], index[b_name]]
+
+
+def _base_index(base):
+    """Contestants of a base network and their name -> index, as in _base_arrays and _base_entries."""
+    if base.topology is not None:
+        contestants, index, _, _, _ = _base_entries(base)
+    else:
+        contestants, index, _ = _base_arrays(base)
+    return contestants, index
+
+
+def _base_entries(base):
+    """
+    Trust entries of a base network, computed once and shared by all overlays on it.
+    Returns (contestants, name -> index, sources, targets, {"trust_mean": entries,
+    "trust_var": entries}).
+    """
+    if getattr(base, "_overlay_base_entries", None) is None:
+        contestants, sources, targets, trust_mean, trust_var = base.trust_entries()
+        base._overlay_base_entries = (
+            contestants,
+            {c.name: i for i, c in enumerate(contestants)},
+            sources,
+            targets,
+            {"trust_mean": trust_mean, "trust_var": trust_var},
+        )
+    return base._overlay_base_entries
+
+
+def _base_arrays(base):
+    """
+    Dense trust arrays of a base network, computed once and shared by all overlays on it.
+    Returns (contestants, name -> index, {"trust_mean": array, "trust_var": array}).
+    """
+    if getattr(base, "_overlay_base_arrays", None) is None:
+        contestants, trust_mean, trust_var = base.trust_arrays()
+        base._overlay_base_arrays = (
+            contestants,
+            {c.name: i for i, c in enumerate(contestants)},
+            {"trust_mean": trust_mean, "trust_var": trust_var},
+        )
+    return base._overlay_base_arrays
+
+
+def _copy_trust_matrix(net):
+    """Copy of the trust matrix of `net` on the same contestant objects, made dense if `net` has none."""
+    if net.trust_matrix is not None:
+        contestants = {id(c): c for c in net.trust_matrix.contestants}
+        return deepcopy(net.trust_matrix, contestants)
+    contestants, trust_mean, trust_var = net.trust_arrays()
+    trust_matrix = TrustMatrix(capacity=max(1, len(contestants)))
+    for c in contestants:
+        trust_matrix.add(c)
+    n = len(contestants)
+    trust_matrix.trust_mean[:n, :n] = trust_mean
+    trust_matrix.trust_var[:n, :n] = trust_var
+    return trust_matrix
@@ -0,0 +1,122 @@
+import json
+import math
+
+import numpy as np
+
+from components.Signals import SplitSignal
+
+
+class EventLog:
+    """
+    Compact record of a game, written as JSON lines so that it can be replayed offline.
+    The first line ("start") holds the contestants and the initial trust of every relationship
+    of the true network, as [source index, target index, trust_mean, trust_var] entries.
+    Then one "round" line is written per vote, with the interactions chosen and their success,
+    the resulting trust deltas, the votes cast and the eviction.
+    With divergence=True, each round also holds the Divergence metrics of every contestant's
+    estimated network at the time of the vote.
+    """
+
+    def __init__(self, filename, net, divergence=False):
+        self.filename = filename
+        self.divergence = divergence
+        self.file = open(filename, "w")
+        contestants, *entries = _relationships(net)
+        self._write(
+            {
+                "type": "start",
+                "contestants": [c.name for c in contestants],
+                "relationships": [
+                    [source, target, mean, var]
+                    for source, target, mean, var in zip(
+                        *(values.tolist() for values in entries)
+                    )
+                ],
+            }
+        )
+        self.round = 0
+        self.current = self._new_round()
+
+    def record_interaction(self, interaction, success):
+        self.current["interactions"].append(
+            {
+                "kind": type(interaction).__name__,
+                "interactor": interaction.interactor.name,
+                "interacted": [c.name for c in interaction.interacted_group],
+                "target": [c.name for c in interaction.target_group],
+                "success": bool(success),
+            }
+        )
+
+    def record_trust_delta(self, a, b, delta):
+        self.current["trust_deltas"].append([a.name, b.name, delta])
+
+    def record_divergence(self, contestants, metrics):
+        self.current["divergence"] = {
+            "contestants": [c.name for c in contestants],
+            **{
+                metric: [None if math.isnan(v) else v for v in values.tolist()]
+                for metric, values in metrics.items()
+            },
+        }
+
+    def record_votes(self, votes, outcome):
+        """Records the votes of the round and its outcome, which ends the round."""
+        self.current["votes"] = [
+            [voter.name, None if vote is SplitSignal else vote.name]
+            for voter, vote in votes
+        ]
+        self.current["split"] = outcome is SplitSignal
+        self.current["evicted"] = None if outcome is SplitSignal else outcome.name
+        self._write(self.current)
+        self.round += 1
+        self.current = self._new_round()
+
+    def close(self):
+        self.file.close()
+
+    def _new_round(self):
+        return {
+            "type": "round",
+            "round": self.round,
+            "interactions": [],
+            "trust_deltas": [],
+        }
+
+    def _write(self, event):
+        self.file.write(json.dumps(event, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+
+def _relationships(net):
+    """
+    Returns (contestants, sources, targets, trust_mean, trust_var) of every directed relationship
+    of `net`, with sources and targets as indices into contestants.
+    """
+    if net.topology is not None:
+        contestants = net.get_all_contestants()
+        trust = net.trust_matrix
+        ids = np.array([trust.index(c) for c in contestants], dtype=int)
+        return (contestants, *trust.entries(ids))
+    # Everyone has a relationship with everyone else
+    contestants, trust_mean, trust_var = net.trust_arrays()
+    sources, targets = np.nonzero(~np.eye(len(contestants), dtype=bool))
+    return (
+        contestants,
+        sources,
+        targets,
+        trust_mean[sources, targets],
+        trust_var[sources, targets],
+    )
+
+
+def load_events(filename):
+    """
+    Reads an event log.
+    :return: (start event, list of round events)
+    """
+    with open(filename) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if not events or events[0]["type"] != "start":
+        raise ValueError(f"{filename} is not an event log")
+    return events[0], events[1:]
@@ -1,10 +1,18 @@
-import random
-
-
 class InteractionHandler:
     def get_interaction_success(self, net, interaction):
         raise Exception("This function should be overwritten by derived class!")
 
+    def success_probability(self, net, interaction):
+        """Probability that `interaction` succeeds, for strategies planning ahead."""
+        raise Exception("This function should be overwritten by derived class!")
+
+    def get_interaction_successes(self, net, interactions):
+        """Resolves a whole phase of interactions at once, returning one bool per interaction."""
+        return [
+            self.get_interaction_success(net, interaction)
+            for interaction in interactions
+        ]
+
 
 class RandomInteractionHandler(InteractionHandler):
     """
@@ -15,4 +23,10 @@ class RandomInteractionHandler(InteractionHandler):
         self.success_prob = success_prob
 
     def get_interaction_success(self, net, interaction):
-        return random.uniform(0, 1) < self.success_prob
+        return net.rng.random() < self.success_prob
+
+    def success_probability(self, net, interaction):
+        return self.success_prob
+
+    def get_interaction_successes(self, net, interactions):
+        return (net.rng.random(len(interactions)) < self.success_prob).tolist()
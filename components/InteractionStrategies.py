@@ -1,29 +1,183 @@
-import random
+import time
+
+import numpy as np
+
+from components import MonteCarlo
+from components.Backends import run_sync
 
 
 class InteractionStrategy:
     def choose(self, true_net, voter):
         raise Exception("This function should be overwritten by derived class!")
 
+    async def choose_async(self, true_net, voter):
+        """
+        `choose` for concurrent interaction phases, see SocialNetwork.interaction_phase_async.
+        By default it simply runs `choose`; strategies which wait on an agent backend override it.
+        """
+        return self.choose(true_net, voter)
+
 
 class RandomInteractionChoice(InteractionStrategy):
     def choose(self, true_net, voter):
         """
-        In this strategy, the voter will choose 1 interacter and 1 target at random
+        In this strategy, the voter will choose 1 interacter among their neighbours and
+        1 target among the interacter's neighbours at random.
+        Returns None if the voter has no neighbours left.
         """
-        possible_interacted = [
-            c for c in true_net.get_all_contestants() if c is not voter
-        ]
-        interacted = random.sample(possible_interacted, 1)
-        possible_targets = [
-            c for c in true_net.get_all_contestants() if c not in interacted
-        ]
-        target = random.sample(possible_targets, 1)
+        possible_interacted = true_net.neighbours(voter)
+        if not possible_interacted:
+            return None
         possible_interactions = [Increase_Trust, Decrease_Trust]
-        interaction = random.choice(possible_interactions)
+        # All three choices in a single draw from the network's random stream
+        draws = true_net.rng.random(3)
+        interacted = [possible_interacted[int(draws[0] * len(possible_interacted))]]
+        possible_targets = true_net.neighbours(interacted[0])
+        target = [possible_targets[int(draws[1] * len(possible_targets))]]
+        interaction = possible_interactions[int(draws[2] * len(possible_interactions))]
         return interaction(voter, interacted, target)
 
 
+class LookaheadInteractionChoice(InteractionStrategy):
+    """
+    Utility-maximizing strategy: the voter picks the interaction which maximizes their chance of
+    never being evicted (within `horizon` votes if given), according to their estimated social
+    network. Every candidate (a neighbour to interact with, one of their neighbours as target,
+    Increase or Decrease) is scored by its expected utility over success and failure, weighted
+    by the interaction handler's success probability.
+    The outcomes of all candidates are simulated together on the same sampled games (common
+    random numbers), in batches of `batch_size` games until `n_trials` games are played or
+    `time_budget` seconds have passed. The budget is checked between chunks of candidates, so
+    when it runs out only the candidates simulated so far are scored. A time budget makes
+    choices depend on machine speed.
+    Falls back to a random choice when the voter's beliefs cannot be simulated in batch, or when
+    the budget runs out before any candidate is scored.
+    """
+
+    def __init__(self, n_trials=200, batch_size=50, time_budget=None, horizon=None):
+        self.n_trials = n_trials
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.horizon = horizon
+
+    def choose(self, true_net, voter):
+        start_time = time.perf_counter()
+        deadline = None if self.time_budget is None else start_time + self.time_budget
+        estimated = voter.estimated_social_network
+        possible_interacted = true_net.neighbours(voter)
+        if not possible_interacted or not MonteCarlo.batch_supported(estimated):
+            return RandomInteractionChoice().choose(true_net, voter)
+
+        contestants = estimated.get_all_contestants()
+        trust_mean, trust_var, thresholds = MonteCarlo.network_state(estimated)
+        position = {c.name: i for i, c in enumerate(contestants)}
+        # Variants of the estimated network to simulate: for each neighbour, the failure of
+        # interacting with them (the same for every target and kind), then the success of each
+        # candidate with them. Variants are simulated in order, so a simulation cut short by
+        # the time budget still scores whole candidates.
+        interactions = []
+        variants = []
+        success_index = []
+        failure_index = []
+        for interacted in possible_interacted:
+            failure = len(variants)
+            variants.append((position[interacted.name], position[voter.name], -1))
+            for target in true_net.neighbours(interacted):
+                for interaction in (Increase_Trust, Decrease_Trust):
+                    interactions.append(interaction(voter, [interacted], [target]))
+                    success_index.append(len(variants))
+                    failure_index.append(failure)
+                    variants.append(
+                        (
+                            position[interacted.name],
+                            position[target.name],
+                            1 if interaction is Increase_Trust else -1,
+                        )
+                    )
+        rows, cols, deltas = (np.array(column) for column in zip(*variants))
+
+        survived = np.zeros(len(variants))
+        played = np.zeros(len(variants))
+        n_trials = 0
+        # With a time budget, batches start at a single game and double, to not overshoot it
+        batch_size = self.batch_size if self.time_budget is None else 1
+        while n_trials < self.n_trials:
+            n = min(batch_size, self.n_trials - n_trials)
+            batch_size = min(2 * batch_size, self.batch_size)
+            batch_survived, batch_played = MonteCarlo.simulate_survival(
+                trust_mean,
+                trust_var,
+                thresholds,
+                position[voter.name],
+                rows,
+                cols,
+                deltas,
+                n,
+                estimated.rng,
+                self.horizon,
+                deadline,
+            )
+            survived += batch_survived
+            played += batch_played
+            n_trials += n
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        # Variants the budget did not reach have no utility
+        with np.errstate(invalid="ignore"):
+            utility = survived / played
+
+        success_prob = np.array(
+            [
+                true_net.interaction_handler.success_probability(true_net, interaction)
+                for interaction in interactions
+            ]
+        )
+        expected = (
+            success_prob * utility[success_index]
+            + (1 - success_prob) * utility[failure_index]
+        )
+        if np.isnan(expected).all():
+            return RandomInteractionChoice().choose(true_net, voter)
+        return interactions[int(np.nanargmax(expected))]
+
+
+class BackendInteractionChoice(InteractionStrategy):
+    """
+    Interactions are chosen by a policy running on an AgentBackend (see components.Backends),
+    which gets the voter's neighbours and the neighbours of each of them.
+    Contestants with this strategy cannot be saved in checkpoints.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def choose(self, true_net, voter):
+        return run_sync(self.choose_async(true_net, voter))
+
+    async def choose_async(self, true_net, voter):
+        interacted = {c.name: c for c in true_net.neighbours(voter)}
+        targets = {
+            name: {t.name: t for t in true_net.neighbours(c)}
+            for name, c in interacted.items()
+        }
+        response = await self.backend.submit(
+            "interaction",
+            {
+                "interactor": voter.name,
+                "neighbours": {name: list(names) for name, names in targets.items()},
+            },
+        )
+        if response is None:
+            return None
+        name = response["interacted"]
+        if response["target"] not in targets.get(name, {}):
+            raise ValueError(f"{voter} cannot choose the interaction {response!r}")
+        interaction = Increase_Trust if response["increase"] else Decrease_Trust
+        return interaction(
+            voter, [interacted[name]], [targets[name][response["target"]]]
+        )
+
+
 class Interaction:
     def __init__(self, interactor, interacted_group, target_group):
         """instantiate the intraction with the interactor, interacted_group, and target_group"""
@@ -43,29 +197,18 @@ class Increase_Trust(Interaction):
         # On success, the interacted group will trust the target group more
         for a in self.interacted_group:
             for b in self.target_group:
-                relationship = social_net.graph.get_edge_data(a, b)["relationship"]
-                relationship.trust_mean[a.name] += 1
-
-                a.estimated_social_network.graph.get_edge_data(a, b)[
-                    "relationship"
-                ].trust_mean[a.name] += 1
-                b.estimated_social_network.graph.get_edge_data(a, b)[
-                    "relationship"
-                ].trust_mean[a.name] += 1
+                social_net.change_trust(a, b, 1)
+                a.estimated_social_network.change_trust(a, b, 1)
+                b.estimated_social_network.change_trust(a, b, 1)
 
     def failure(self, social_net):
         # On failure, the interacted group will trust the interactor less
         for a in self.interacted_group:
-            relationship = social_net.graph.get_edge_data(a, self.interactor)[
-                "relationship"
-            ]
-            relationship.trust_mean[a.name] -= 1
-            a.estimated_social_network.graph.get_edge_data(a, self.interactor)[
-                "relationship"
-            ].trust_mean[a.name] -= 1
-            self.interactor.estimated_social_network.graph.get_edge_data(
-                a, self.interactor
-            )["relationship"].trust_mean[a.name] -= 1
+            social_net.change_trust(a, self.interactor, -1)
+            a.estimated_social_network.change_trust(a, self.interactor, -1)
+            self.interactor.estimated_social_network.change_trust(
+                a, self.interactor, -1
+            )
 
 
 class Decrease_Trust(Interaction):
@@ -73,25 +216,15 @@ class Decrease_Trust(Interaction):
         # On success, the interacted group will trust the target group less
         for a in self.interacted_group:
             for b in self.target_group:
-                relationship = social_net.graph.get_edge_data(a, b)["relationship"]
-                relationship.trust_mean[a.name] -= 1
-                a.estimated_social_network.graph.get_edge_data(a, b)[
-                    "relationship"
-                ].trust_mean[a.name] -= 1
-                b.estimated_social_network.graph.get_edge_data(a, b)[
-                    "relationship"
-                ].trust_mean[a.name] -= 1
+                social_net.change_trust(a, b, -1)
+                a.estimated_social_network.change_trust(a, b, -1)
+                b.estimated_social_network.change_trust(a, b, -1)
 
     def failure(self, social_net):
         # On failure, the interacted group will trust the interactor less
         for a in self.interacted_group:
-            relationship = social_net.graph.get_edge_data(a, self.interactor)[
-                "relationship"
-            ]
-            relationship.trust_mean[a.name] -= 1
-            a.estimated_social_network.graph.get_edge_data(a, self.interactor)[
-                "relationship"
-            ].trust_mean[a.name] -= 1
-            self.interactor.estimated_social_network.graph.get_edge_data(
-                a, self.interactor
-            )["relationship"].trust_mean[a.name] -= 1
+            social_net.change_trust(a, self.interactor, -1)
+            a.estimated_social_network.change_trust(a, self.interactor, -1)
+            self.interactor.estimated_social_network.change_trust(
+                a, self.interactor, -1
+            )
@@ -0,0 +1,699 @@
+import functools
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+from components.Signals import SplitSignal
+from components.VotingStrategies import TrustVoteChoice
+
+# Codes used in eviction arrays: contestant indices are >= 0
+SPLIT = -1
+GAME_OVER = -2
+
+# Upper bound on the number of sampled trust entries held in memory at once
+MAX_CHUNK_ENTRIES = 2**22
+# Smaller chunks when working to a deadline, so that it is checked every few tens of ms
+DEADLINE_CHUNK_ENTRIES = MAX_CHUNK_ENTRIES // 8
+
+
+def batch_supported(net):
+    """The batched engine resolves votes with array ops, which is only implemented for TrustVoteChoice."""
+    return all(
+        isinstance(c.voting_strategy, TrustVoteChoice) for c in net.iter_contestants()
+    )
+
+
+def MC_simulate_games(net, n=100, rng=None, incremental=False):
+    """
+    Batched equivalent of Contestant.MC_simulate_games: runs `n` simulated games on `net` at once.
+    Returns {round: {contestant or SplitSignal: probability}}.
+    Random numbers are drawn from `rng`, by default the random stream of `net`.
+    With incremental=True, see simulate_game_incremental.
+    """
+    rng = net.rng if rng is None else rng
+    evictions = _simulator(net)(n, rng=rng, incremental=incremental)
+    return eviction_distribution(evictions, net.get_all_contestants())
+
+
+def MC_simulate_reweighted(net, n=100, samples=None, ess_threshold=0.5, rng=None):
+    """
+    Like MC_simulate_games(incremental=True), but keeps the sampled games to reuse them on later
+    calls: pass the `samples` returned by the previous call. As long as only uncertain trust
+    changes, the games are reweighted by their likelihood ratio under the new trust instead of
+    being sampled again (see SampledGames.reweighted). New games are sampled when the effective
+    sample size drops below `ess_threshold` * n, or when the samples cannot be reused.
+    :return: (distribution as in MC_simulate_games, samples)
+    """
+    rng = net.rng if rng is None else rng
+    contestants = net.get_all_contestants()
+    trust_mean, trust_var, thresholds = network_state(net)
+    names = [c.name for c in contestants]
+    if samples is not None and len(samples.log_weights) == n:
+        samples = samples.reweighted(names, trust_mean, trust_var, thresholds, rng)
+    else:
+        samples = None
+    if samples is None or samples.effective_sample_size() < ess_threshold * n:
+        samples = SampledGames.sample(names, trust_mean, trust_var, thresholds, n, rng)
+    counts = round_counts(samples.evictions, len(contestants), samples.weights())
+    return distribution_from_counts(counts, contestants), samples
+
+
+class SampledGames:
+    """
+    Games played by the incremental engine (one sampled world per game), with importance weights.
+    Only the samples of uncertain trust entries are kept: the others equal their mean.
+    """
+
+    def __init__(
+        self, names, trust_mean, trust_var, thresholds, rows, cols, values, log_weights
+    ):
+        self.names = names
+        self.trust_mean = trust_mean
+        self.trust_var = trust_var
+        self.thresholds = thresholds
+        # Sampled trust of entries [rows[u], cols[u]]: values[g, u] in game g
+        self.rows = rows
+        self.cols = cols
+        self.values = values
+        self.log_weights = log_weights
+        self.evictions = None
+
+    @classmethod
+    def sample(cls, names, trust_mean, trust_var, thresholds, n, rng):
+        rows, cols = np.nonzero(_uncertain(trust_mean, trust_var))
+        values = trust_mean[rows, cols] + trust_var[rows, cols] * rng.standard_normal(
+            (n, len(rows))
+        )
+        samples = cls(
+            names, trust_mean, trust_var, thresholds, rows, cols, values, np.zeros(n)
+        )
+        samples.play(rng)
+        return samples
+
+    def reweighted(self, names, trust_mean, trust_var, thresholds, rng):
+        """
+        The same games, under a new state of the network with contestants `names`. Games are
+        reweighted by the likelihood ratio of their sampled trust, the marginal of which is
+        unchanged by evictions. Certain trust and thresholds have no samples, so games are
+        played again on the same worlds when they change. Returns None when the games cannot
+        be reused: when a contestant is new, or an entry switches between certain and uncertain.
+        """
+        position = {name: i for i, name in enumerate(self.names)}
+        if any(name not in position for name in names):
+            return None
+        ids = np.array([position[name] for name in names], dtype=int)
+        old_mean = self.trust_mean[np.ix_(ids, ids)]
+        old_var = self.trust_var[np.ix_(ids, ids)]
+        uncertain = _uncertain(trust_mean, trust_var)
+        if (uncertain != _uncertain(old_mean, old_var)).any():
+            return None
+        # Uncertain entries between contestants still in the game, in the new positions
+        new_position = np.full(len(self.names), -1)
+        new_position[ids] = np.arange(len(ids))
+        rows, cols = new_position[self.rows], new_position[self.cols]
+        kept = (rows >= 0) & (cols >= 0)
+        rows, cols, values = rows[kept], cols[kept], self.values[:, kept]
+        log_weights = self.log_weights.copy()
+        changed = (trust_mean[rows, cols] != old_mean[rows, cols]) | (
+            trust_var[rows, cols] != old_var[rows, cols]
+        )
+        if changed.any():
+            x = values[:, changed]
+            log_weights += (
+                _log_normal_pdf(
+                    x, trust_mean[rows, cols][changed], trust_var[rows, cols][changed]
+                )
+                - _log_normal_pdf(
+                    x, old_mean[rows, cols][changed], old_var[rows, cols][changed]
+                )
+            ).sum(axis=1)
+        samples = SampledGames(
+            names, trust_mean, trust_var, thresholds, rows, cols, values, log_weights
+        )
+        certain = ~uncertain & np.isfinite(trust_mean)
+        if (
+            len(ids) == len(self.names)
+            and (ids == np.arange(len(ids))).all()
+            and (trust_mean[certain] == old_mean[certain]).all()
+            and (thresholds == self.thresholds).all()
+        ):
+            samples.evictions = self.evictions
+        else:
+            samples.play(rng)
+        return samples
+
+    def play(self, rng):
+        """Plays every game on its sampled world, in chunks of (games, N, N) trust tensors."""
+        n_contestants = len(self.names)
+        n = len(self.log_weights)
+        chunk_size = max(1, MAX_CHUNK_ENTRIES // max(1, n_contestants**2))
+        self.evictions = np.full((n, n_contestants + 1), GAME_OVER, dtype=int)
+        for start in range(0, n, chunk_size):
+            stop = min(n, start + chunk_size)
+            realized = np.repeat(self.trust_mean[None], stop - start, axis=0)
+            realized[:, self.rows, self.cols] = self.values[start:stop]
+            self.evictions[start:stop] = _play_incremental(
+                realized, self.thresholds, rng
+            )
+
+    def weights(self):
+        return np.exp(self.log_weights - self.log_weights.max())
+
+    def effective_sample_size(self):
+        weights = self.weights()
+        return weights.sum() ** 2 / (weights**2).sum()
+
+
+def simulate_evictions(
+    trust_mean,
+    trust_var,
+    thresholds,
+    n,
+    rng=None,
+    chunk_size=None,
+    incremental=False,
+):
+    """
+    Simulates `n` games of TrustVoteChoice voters in chunks of (games, N, N) sampled-trust tensors.
+    Returns an (n, N + 1) int array, row g holding the outcome of each successive vote of game g:
+    a contestant index, SPLIT, or GAME_OVER once the game has ended.
+    With incremental=True, trust is sampled once per game and votes are kept up to date
+    with simulate_game_incremental, instead of re-sampling trust before every vote.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    n_contestants = len(thresholds)
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CHUNK_ENTRIES // max(1, n_contestants**2))
+    evictions = np.full((n, n_contestants + 1), GAME_OVER, dtype=int)
+    for start in range(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        simulate_chunk = _simulate_chunk_incremental if incremental else _simulate_chunk
+        evictions[start:stop] = simulate_chunk(
+            trust_mean, trust_var, thresholds, stop - start, rng
+        )
+    return evictions
+
+
+def simulate_entries(
+    entries,
+    thresholds,
+    n,
+    rng=None,
+    chunk_size=None,
+    incremental=False,
+):
+    """
+    simulate_evictions for a network with a topology, on its (sources, targets, trust_mean,
+    trust_var) trust entries (see network_entries) instead of N x N arrays: chunks hold
+    (games, entries) sampled trust, so memory is linear in the number of relationships.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    sources, targets, trust_mean, trust_var = entries
+    n_contestants = len(thresholds)
+    indptr = np.searchsorted(sources, np.arange(n_contestants + 1))
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CHUNK_ENTRIES // max(1, len(sources)))
+    evictions = np.full((n, n_contestants + 1), GAME_OVER, dtype=int)
+    for start in range(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        simulate_chunk = (
+            _simulate_entry_chunk_incremental if incremental else _simulate_entry_chunk
+        )
+        evictions[start:stop] = simulate_chunk(
+            indptr, targets, trust_mean, trust_var, thresholds, stop - start, rng
+        )
+    return evictions
+
+
+def eviction_distribution(evictions, contestants):
+    """Converts an eviction array into the per-round distribution returned by MC_simulate_games."""
+    # Only the rounds which some game reached are counted, the others are empty
+    n_rounds = np.count_nonzero((evictions != GAME_OVER).any(axis=0))
+    return distribution_from_counts(
+        round_counts(evictions[:, :n_rounds], len(contestants)), contestants
+    )
+
+
+def round_counts(evictions, n_contestants, weights=None):
+    """
+    Counts outcomes per round: entry [i, k] is the number of games whose vote i + 1 evicted
+    contestant k, or split for k = N. With `weights`, games are counted with their weight.
+    Only the rounds of the columns of `evictions` are counted, up to N.
+    """
+    n_rounds = min(n_contestants, evictions.shape[1])
+    counts = np.zeros(
+        (n_rounds, n_contestants + 1), dtype=int if weights is None else float
+    )
+    for i in range(n_rounds):
+        column = evictions[:, i]
+        played = column != GAME_OVER
+        # SPLIT (-1) maps onto the last bin
+        counts[i] = np.bincount(
+            column[played] % (n_contestants + 1),
+            None if weights is None else weights[played],
+            minlength=n_contestants + 1,
+        )
+    return counts
+
+
+def distribution_from_counts(counts, contestants):
+    outcomes = list(contestants) + [SplitSignal]
+    result_dict = {}
+    for i, row in enumerate(counts, start=1):
+        total = row.sum()
+        result_dict[i] = {
+            outcomes[k]: float(row[k]) / float(total) for k in np.flatnonzero(row)
+        }
+    # Rounds which were not counted are empty
+    for i in range(len(counts) + 1, len(contestants) + 1):
+        result_dict[i] = {}
+    return result_dict
+
+
+def MC_simulate_adaptive(
+    net,
+    ci_width=0.05,
+    confidence=0.95,
+    batch_size=100,
+    max_trials=10000,
+    max_time=None,
+    min_reach=0.05,
+    rng=None,
+):
+    """
+    Runs simulated games on `net` in batches until, for every round reached by at least a
+    `min_reach` fraction of the games, each eviction probability is known to within a `confidence`
+    Wilson interval of width `ci_width`, or until `max_trials` games / `max_time` seconds are used.
+    Rounds which no game reached are never considered, so with `min_reach=0` every round reached
+    by at least one game is.
+    The next batch is sized from the current widths, so close decisions get more trials.
+    :return: (distribution as in MC_simulate_games, {round: {outcome: interval half-width}}, trials)
+    """
+    start_time = time.perf_counter()
+    rng = net.rng if rng is None else rng
+    simulate = _simulator(net)
+    contestants = net.get_all_contestants()
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    counts = np.zeros((len(contestants), len(contestants) + 1), dtype=int)
+    n_trials = 0
+    n_batch = min(batch_size, max_trials)
+    while n_batch > 0:
+        evictions = simulate(n_batch, rng=rng)
+        counts += round_counts(evictions, len(contestants))
+        n_trials += n_batch
+        half_widths = wilson_half_widths(counts, z)
+        reached = counts.sum(axis=1)
+        considered = (reached >= min_reach * n_trials) & (reached > 0)
+        widest = 2 * half_widths[considered].max(initial=0)
+        if widest <= ci_width:
+            break
+        if max_time is not None and time.perf_counter() - start_time >= max_time:
+            break
+        # Interval widths shrink as 1 / sqrt(n)
+        needed = int(n_trials * ((widest / ci_width) ** 2 - 1)) + 1
+        n_batch = min(max(needed, batch_size), max_trials - n_trials)
+    errors = {
+        i: {
+            outcome: float(half_widths[i - 1, k])
+            for k, outcome in enumerate(contestants + [SplitSignal])
+            if counts[i - 1, k] > 0
+        }
+        for i in range(1, 1 + len(contestants))
+    }
+    return distribution_from_counts(counts, contestants), errors, n_trials
+
+
+def wilson_half_widths(counts, z):
+    """Half-widths of the Wilson score intervals of the per-round outcome frequencies in `counts`."""
+    n = counts.sum(axis=1, keepdims=True).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = counts / n
+        half_widths = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return np.where(n > 0, half_widths, np.inf)
+
+
+def resolve_votes(realized, immune, thresholds, rng):
+    """
+    Vectorized TrustVoteChoice for every voter of every game.
+    realized: (games, N, N) trust, immune: (games, N) bool mask.
+    Returns (games, N) votes, holding the index of the voted contestant or SPLIT.
+    `realized` is overwritten.
+    """
+    return TrustVoteChoice.resolve(
+        realized, immune, thresholds, rng, overwrite_trust=True
+    )
+
+
+def count_votes(votes, n_contestants):
+    """
+    Tallies (games, N) votes like SocialNetwork.simulate_vote.
+    Returns (games,) outcomes: the most voted contestant, ties going to the one voted for first,
+    or SPLIT if every voter split.
+    """
+    n_games = len(votes)
+    games, voters = np.nonzero(votes >= 0)
+    # Ballots are in voting order within each game, so the first of each is its first vote
+    ballots = games * n_contestants + votes[games, voters]
+    counts = np.bincount(ballots, minlength=n_games * n_contestants).reshape(
+        n_games, n_contestants
+    )
+    first_vote = np.full(n_games * n_contestants, n_contestants)
+    voted, first = np.unique(ballots, return_index=True)
+    first_vote[voted] = voters[first]
+    score = counts * (n_contestants + 1) + (
+        n_contestants - first_vote.reshape(n_games, n_contestants)
+    )
+    return np.where(counts.any(axis=1), score.argmax(axis=1), SPLIT)
+
+
+def resolve_entry_votes(realized, indptr, targets, immune, thresholds, rng):
+    """
+    resolve_votes on trust entries: realized[g, e] is the trust in game g of the voter of entry e
+    towards targets[e], the entries of voter i being indptr[i]:indptr[i + 1], sorted by target.
+    Returns (games, N) votes, holding the index of the voted contestant or SPLIT.
+    `realized` is overwritten.
+    """
+    n_games = len(realized)
+    n_contestants = len(thresholds)
+    sources = np.repeat(np.arange(n_contestants), np.diff(indptr))
+    votes = np.full((n_games, n_contestants), SPLIT)
+    lowest = np.full((n_games, n_contestants), np.inf)
+    # Voters without relationships have nobody to vote for
+    voters = np.flatnonzero(np.diff(indptr))
+    if len(voters) == 0:
+        return votes
+    np.copyto(realized, np.inf, where=immune[:, targets])
+    lowest[:, voters] = np.minimum.reduceat(realized, indptr[voters], axis=1)
+    at_lowest = realized == lowest[:, sources]
+    # Any agent with lowest trust may be chosen, so break exact ties at random
+    keys = at_lowest.astype(float)
+    n_lowest = np.add.reduceat(at_lowest, indptr[voters], axis=1)
+    tied = np.zeros((n_games, n_contestants), dtype=bool)
+    tied[:, voters] = n_lowest > 1
+    tied &= np.isfinite(lowest)
+    if tied.any():
+        draw = at_lowest & tied[:, sources]
+        keys[draw] += rng.random(np.count_nonzero(draw))
+    highest = np.maximum.reduceat(keys, indptr[voters], axis=1)
+    chosen_games, chosen = np.nonzero(
+        at_lowest & (keys == np.repeat(highest, np.diff(indptr)[voters], axis=1))
+    )
+    votes[chosen_games, sources[chosen]] = targets[chosen]
+    # Split when nobody can be chosen or everyone is trusted above the threshold
+    votes[lowest > thresholds] = SPLIT
+    return votes
+
+
+def sample_trust(trust_mean, trust_var, n_games, rng):
+    """
+    Returns (n_games, N, N) sampled trust, or (n_games, entries) for trust entries. Only
+    uncertain entries are drawn: in an estimated network that is the trust of the owner's
+    neighbours towards them, so the other entries are simply copied from their mean.
+    """
+    uncertain = np.nonzero(_uncertain(trust_mean, trust_var))
+    realized = np.repeat(trust_mean[None], n_games, axis=0)
+    realized[(slice(None), *uncertain)] += trust_var[uncertain] * rng.standard_normal(
+        (n_games, len(uncertain[0]))
+    )
+    return realized
+
+
+def _simulate_chunk(trust_mean, trust_var, thresholds, n_games, rng):
+    n_contestants = len(thresholds)
+    evictions = np.full((n_games, n_contestants + 1), GAME_OVER, dtype=int)
+    immune = np.zeros((n_games, n_contestants), dtype=bool)
+    running = np.arange(n_games)
+    for step in range(n_contestants + 1):
+        if len(running) == 0:
+            break
+        # Trust is re-sampled before every vote, as in SocialNetwork.simulate_vote
+        realized = sample_trust(trust_mean, trust_var, len(running), rng)
+        votes = resolve_votes(realized, immune[running], thresholds, rng)
+        outcome = count_votes(votes, n_contestants)
+        evictions[running, step] = outcome
+        evicted = outcome != SPLIT
+        immune[running[evicted], outcome[evicted]] = True
+        running = running[evicted]
+    return evictions
+
+
+def _simulate_entry_chunk(
+    indptr, targets, trust_mean, trust_var, thresholds, n_games, rng
+):
+    n_contestants = len(thresholds)
+    evictions = np.full((n_games, n_contestants + 1), GAME_OVER, dtype=int)
+    immune = np.zeros((n_games, n_contestants), dtype=bool)
+    running = np.arange(n_games)
+    for step in range(n_contestants + 1):
+        if len(running) == 0:
+            break
+        realized = sample_trust(trust_mean, trust_var, len(running), rng)
+        votes = resolve_entry_votes(
+            realized, indptr, targets, immune[running], thresholds, rng
+        )
+        outcome = count_votes(votes, n_contestants)
+        evictions[running, step] = outcome
+        evicted = outcome != SPLIT
+        immune[running[evicted], outcome[evicted]] = True
+        running = running[evicted]
+    return evictions
+
+
+def simulate_game_incremental(order, trust, thresholds):
+    """
+    Plays one game of TrustVoteChoice voters in a single sampled world. Row i of `order` lists
+    every contestant by increasing trust of voter i (ties broken at random beforehand, with an
+    infinite trust in yourself), or only those they have a relationship with, and row i of
+    `trust` holds the matching trust values.
+    Candidates only ever drop out by becoming immune, so each voter keeps a cursor on their
+    ordering which only moves forward: a whole game costs O(N^2) on top of the O(N^2 log N)
+    sort, instead of the O(N^3) of recomputing every vote from scratch.
+    As the world is fixed, a voter torn between equally trusted candidates sticks with the same
+    one for the whole game.
+    Returns the list of outcomes of the votes: contestant indices, then SPLIT.
+    """
+    n_contestants = len(thresholds)
+    cursors = [0] * n_contestants
+    immune = [False] * n_contestants
+    outcomes = []
+    while True:
+        counts = [0] * n_contestants
+        voted = []
+        for i in range(n_contestants):
+            candidates = order[i]
+            k = cursors[i]
+            while k < len(candidates) and immune[candidates[k]]:
+                k += 1
+            cursors[i] = k
+            # Split when nobody is left or everyone is trusted above the threshold
+            if k == len(candidates) or trust[i][k] > thresholds[i]:
+                continue
+            j = candidates[k]
+            if counts[j] == 0:
+                voted.append(j)
+            counts[j] += 1
+        if not voted:
+            outcomes.append(SPLIT)
+            return outcomes
+        # Ties go to the contestant voted for first, as in SocialNetwork.count_votes
+        evicted = max(voted, key=counts.__getitem__)
+        immune[evicted] = True
+        outcomes.append(evicted)
+
+
+def _simulate_chunk_incremental(trust_mean, trust_var, thresholds, n_games, rng):
+    realized = sample_trust(trust_mean, trust_var, n_games, rng)
+    return _play_incremental(realized, thresholds, rng)
+
+
+def _play_incremental(realized, thresholds, rng):
+    """Plays one game per (N, N) world of `realized` trust, which is modified in place."""
+    n_games, n_contestants, _ = realized.shape
+    evictions = np.full((n_games, n_contestants + 1), GAME_OVER, dtype=int)
+    diagonal = np.arange(n_contestants)
+    realized[:, diagonal, diagonal] = np.inf
+    # Sort every voter's candidates of every game at once, by trust and then a random key
+    order = np.lexsort((rng.random(realized.shape), realized), axis=-1)
+    trust = np.take_along_axis(realized, order, axis=-1)
+    thresholds = thresholds.tolist()
+    for g in range(n_games):
+        outcomes = simulate_game_incremental(
+            order[g].tolist(), trust[g].tolist(), thresholds
+        )
+        evictions[g, : len(outcomes)] = outcomes
+    return evictions
+
+
+def _simulate_entry_chunk_incremental(
+    indptr, targets, trust_mean, trust_var, thresholds, n_games, rng
+):
+    realized = sample_trust(trust_mean, trust_var, n_games, rng)
+    n_contestants = len(thresholds)
+    evictions = np.full((n_games, n_contestants + 1), GAME_OVER, dtype=int)
+    # Sort every voter's candidates of every game at once, by trust and then a random key
+    sources = np.repeat(np.arange(n_contestants), np.diff(indptr))
+    order = np.lexsort(
+        (
+            rng.random(realized.shape),
+            realized,
+            np.broadcast_to(sources, realized.shape),
+        ),
+        axis=-1,
+    )
+    trust = np.take_along_axis(realized, order, axis=-1)
+    candidates = targets[order]
+    thresholds = thresholds.tolist()
+    for g in range(n_games):
+        outcomes = simulate_game_incremental(
+            [row.tolist() for row in np.split(candidates[g], indptr[1:-1])],
+            [row.tolist() for row in np.split(trust[g], indptr[1:-1])],
+            thresholds,
+        )
+        evictions[g, : len(outcomes)] = outcomes
+    return evictions
+
+
+def simulate_survival(
+    trust_mean,
+    trust_var,
+    thresholds,
+    voter,
+    rows,
+    cols,
+    deltas,
+    n,
+    rng,
+    horizon=None,
+    deadline=None,
+):
+    """
+    Evaluates S variants of one network at once, variant s adding deltas[s] to the mean trust
+    [rows[s], cols[s]]. Every variant is played on the same `n` sampled games (common random
+    numbers), so differences between variants are not drowned in sampling noise.
+    Variants are played in chunks, in order. With a `deadline` (a time.perf_counter() value),
+    chunks are smaller and none starts once it has passed, so later variants may be played on
+    fewer games, or none.
+    Returns (S,) counts of the games in which contestant `voter` is never evicted, within the
+    first `horizon` votes if given, and (S,) counts of the games each variant was played on.
+    """
+    n_contestants = len(thresholds)
+    n_steps = n_contestants + 1 if horizon is None else min(horizon, n_contestants + 1)
+    survived = np.zeros(len(rows), dtype=int)
+    played = np.zeros(len(rows), dtype=int)
+    chunk_entries = MAX_CHUNK_ENTRIES if deadline is None else DEADLINE_CHUNK_ENTRIES
+    # As in sample_trust, only uncertain entries are drawn
+    uncertain = np.nonzero(_uncertain(trust_mean, trust_var))
+    sigma = trust_var[uncertain]
+    games_per_chunk = max(1, MAX_CHUNK_ENTRIES // (n_steps * max(1, len(sigma))))
+    for start in range(0, n, games_per_chunk):
+        n_games = min(n, start + games_per_chunk) - start
+        noise = sigma * rng.standard_normal((n_steps, n_games, len(sigma)))
+        states_per_chunk = max(1, chunk_entries // (n_games * n_contestants**2))
+        for first in range(0, len(rows), states_per_chunk):
+            states = slice(first, first + states_per_chunk)
+            survived[states] += _survival_chunk(
+                trust_mean,
+                uncertain,
+                noise,
+                thresholds,
+                voter,
+                rows[states],
+                cols[states],
+                deltas[states],
+                rng,
+            )
+            played[states] += n_games
+            if deadline is not None and time.perf_counter() >= deadline:
+                return survived, played
+    return survived, played
+
+
+def _survival_chunk(
+    trust_mean, uncertain, noise, thresholds, voter, rows, cols, deltas, rng
+):
+    n_steps, n_games, _ = noise.shape
+    n_contestants = len(thresholds)
+    immune = np.zeros((len(rows), n_games, n_contestants), dtype=bool)
+    alive = np.ones((len(rows), n_games), dtype=bool)
+    # (variant, game) pairs still being played
+    state_i, game_i = np.nonzero(alive)
+    for step in range(n_steps):
+        if len(state_i) == 0:
+            break
+        realized = np.repeat(trust_mean[None], len(state_i), axis=0)
+        realized[:, uncertain[0], uncertain[1]] += noise[step, game_i]
+        realized[np.arange(len(state_i)), rows[state_i], cols[state_i]] += deltas[
+            state_i
+        ]
+        votes = resolve_votes(realized, immune[state_i, game_i], thresholds, rng)
+        outcome = count_votes(votes, n_contestants)
+        evicted = outcome != SPLIT
+        immune[state_i[evicted], game_i[evicted], outcome[evicted]] = True
+        voted_out = outcome == voter
+        alive[state_i[voted_out], game_i[voted_out]] = False
+        # Games end on a split, and stop mattering once the voter is out
+        playing = evicted & ~voted_out
+        state_i, game_i = state_i[playing], game_i[playing]
+    return alive.sum(axis=1)
+
+
+def _uncertain(trust_mean, trust_var):
+    """Mask of the trust entries which are sampled: finite mean and non-zero sigma."""
+    return np.isfinite(trust_mean) & (trust_var > 0)
+
+
+def _log_normal_pdf(x, mean, sigma):
+    """Log density of N(mean, sigma^2) at x, up to the constant -log(2 pi) / 2."""
+    return -np.log(sigma) - (x - mean) ** 2 / (2 * sigma**2)
+
+
+def network_state(net):
+    """Compact, picklable state of `net` needed by the batched engine: trust arrays and thresholds."""
+    if net.topology is not None:
+        raise ValueError(
+            "A network with a topology has no dense trust arrays: see network_entries"
+        )
+    contestants, trust_mean, trust_var = net.trust_arrays()
+    return trust_mean, trust_var, _thresholds(contestants)
+
+
+def network_entries(net):
+    """
+    network_state of a network with a topology: ((sources, targets, trust_mean, trust_var),
+    thresholds), with one entry per directed relationship, see SocialNetwork.trust_entries.
+    """
+    contestants, *entries = net.trust_entries()
+    return tuple(entries), _thresholds(contestants)
+
+
+def batch_state(net):
+    """network_entries of `net` if it has a topology, else its network_state."""
+    return network_entries(net) if net.topology is not None else network_state(net)
+
+
+def simulate_state(state, n, seed_sequence):
+    """
+    Process pool entry point: simulates `n` games from a batch_state with its own random stream.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    if len(state) == 2:
+        entries, thresholds = state
+        return simulate_entries(entries, thresholds, n, rng=rng)
+    trust_mean, trust_var, thresholds = state
+    return simulate_evictions(trust_mean, trust_var, thresholds, n, rng=rng)
+
+
+def _simulator(net):
+    """simulate(n, rng, incremental=False) -> evictions of `n` games of `net`."""
+    if net.topology is not None:
+        entries, thresholds = network_entries(net)
+        return functools.partial(simulate_entries, entries, thresholds)
+    trust_mean, trust_var, thresholds = network_state(net)
+    return functools.partial(simulate_evictions, trust_mean, trust_var, thresholds)
+
+
+def _thresholds(contestants):
+    return np.array(
+        [c.immutable_traits.trust_threshold for c in contestants], dtype=float
+    )
@@ -1,11 +1,66 @@
+import math
+
+
 class RelationshipLink:
-    def __init__(self, contestant1, contestant2):
+    def __init__(self, contestant1, contestant2, trust_matrix=None):
         # Initialize directional trust values for each contestant (by name) and uncertainty.
         # TODO: What is the convention? Is the contestant name the source?
         # eg. [('Filip', 0), ('Kipp', -1)] means trust(Filip -> Kipp) = 0 and trust(Kipp -> Filip) = -1.
-        self.realized_trust = {contestant1.name: None, contestant2.name: None}
-        self.trust_mean = {contestant1.name: 0, contestant2.name: 0}
-        self.trust_var = {contestant1.name: 0, contestant2.name: 0}
+        if trust_matrix is None:
+            self.realized_trust = {contestant1.name: None, contestant2.name: None}
+            self.trust_mean = {contestant1.name: 0, contestant2.name: 0}
+            self.trust_var = {contestant1.name: 0, contestant2.name: 0}
+        else:
+            # Thin views over the trust arrays of the network, keyed by name as above.
+            names = (contestant1.name, contestant2.name)
+            self.realized_trust = TrustView(trust_matrix, "realized_trust", *names)
+            self.trust_mean = TrustView(trust_matrix, "trust_mean", *names)
+            self.trust_var = TrustView(trust_matrix, "trust_var", *names)
 
     def __repr__(self):
         return f"RelationshipLink(trust={self.trust_mean}, var={self.trust_var})"
+
+
+class TrustView:
+    """
+    Dict-like view over one array of a TrustMatrix (or SparseTrust) for the two directions of a
+    single edge.
+    view[name] is the trust of `name` towards the other contestant of the edge.
+    """
+
+    def __init__(self, trust_matrix, field, name1, name2):
+        self.trust_matrix = trust_matrix
+        self.field = field
+        self.others = {name1: name2, name2: name1}
+
+    def _cell(self, name):
+        return self.trust_matrix.cell(name, self.others[name])
+
+    def __getitem__(self, name):
+        value = float(getattr(self.trust_matrix, self.field)[self._cell(name)])
+        return None if math.isnan(value) else value
+
+    def __setitem__(self, name, value):
+        getattr(self.trust_matrix, self.field)[self._cell(name)] = (
+            math.nan if value is None else value
+        )
+        if self.field != "realized_trust":
+            self.trust_matrix.version += 1
+
+    def __iter__(self):
+        return iter(self.others)
+
+    def __len__(self):
+        return len(self.others)
+
+    def keys(self):
+        return self.others.keys()
+
+    def items(self):
+        return [(name, self[name]) for name in self.others]
+
+    def values(self):
+        return [self[name] for name in self.others]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
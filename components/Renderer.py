@@ -0,0 +1,141 @@
+import imageio
+import networkx as nx
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+
+class StreamingRenderer:
+    """
+    Off-screen renderer of a SocialNetwork, which needs no display.
+    Frames are drawn on an Agg canvas and appended straight to an incremental GIF/MP4 writer
+    (the format follows the extension of `filename`; MP4 needs imageio-ffmpeg), so they are never
+    held in memory. Artists are created once per node/edge and updated in place between frames.
+    """
+
+    def __init__(
+        self, filename="animation.gif", duration=200, figsize=(10, 8), pos=None
+    ):
+        """
+        With filename=None, no file is written and frames are only returned by `draw`.
+        `pos` optionally fixes the layout, as a dict of contestant name -> (x, y).
+        """
+        self.filename = filename
+        self.writer = None
+        if filename is None:
+            pass
+        elif str(filename).endswith(".gif"):
+            self.writer = imageio.get_writer(filename, mode="I", duration=duration)
+        else:
+            self.writer = imageio.get_writer(filename, fps=1000 / duration)
+        self.n_frames = 0
+
+        self.fig = Figure(figsize=figsize)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.ax.axis("off")
+        self.title = self.fig.suptitle("", fontsize=16)
+        self.pos = {}
+        if pos:
+            self.pos = {name: np.asarray(xy) for name, xy in pos.items()}
+            self._set_limits()
+        self.edges = LineCollection([], colors="black", zorder=1)
+        self.ax.add_collection(self.edges)
+        self.nodes = self.ax.scatter(
+            [], [], s=500, c="lightblue", edgecolors="none", zorder=2
+        )
+        self.node_labels = {}
+        self.edge_labels = {}
+
+    def render(self, net, round_i, edge_labels=None):
+        """
+        Draws the current state of `net` and streams it as the next frame.
+        `edge_labels` maps (u, v) to the label of the edge; by default the realized trust of `net`.
+        """
+        if not self.pos:
+            self.pos = {
+                c.name: xy for c, xy in nx.spring_layout(net.graph, seed=42).items()
+            }
+            self._set_limits()
+        if edge_labels is None:
+            edge_labels = {
+                (u, v): ", ".join(
+                    f"{name}:{val}"
+                    for name, val in net.get_relationship(u, v).realized_trust.items()
+                )
+                for u, v in net.graph.edges
+            }
+        self.append(
+            self.draw(
+                [c.name for c in net.get_all_contestants()],
+                {(u.name, v.name): label for (u, v), label in edge_labels.items()},
+                round_i,
+            )
+        )
+
+    def append(self, frame):
+        """Streams a frame to the file."""
+        self.writer.append_data(frame)
+        self.n_frames += 1
+
+    def draw(self, names, edge_labels, round_i):
+        """
+        Draws contestants `names` and edges {(name_u, name_v): label}.
+        :return: the frame as an (h, w, 3) RGB array
+        """
+        self.title.set_text(f"A Game of Trust - Round {round_i}")
+
+        xy = np.array([self.pos[name] for name in names]).reshape(-1, 2)
+        self.nodes.set_offsets(xy)
+        self._sync_texts(
+            self.node_labels,
+            {name: (self.pos[name], name) for name in names},
+            dict(fontsize=10, ha="center", va="center", zorder=3),
+        )
+
+        self.edges.set_segments([(self.pos[u], self.pos[v]) for u, v in edge_labels])
+        self._sync_texts(
+            self.edge_labels,
+            {
+                (u, v): ((self.pos[u] + self.pos[v]) / 2, label)
+                for (u, v), label in edge_labels.items()
+            },
+            dict(
+                fontsize=10,
+                color="red",
+                ha="center",
+                va="center",
+                zorder=3,
+                bbox=dict(boxstyle="round", ec="white", fc="white"),
+            ),
+        )
+
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())[..., :3].copy()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def _sync_texts(self, artists, wanted, style):
+        """Updates text artists in place, adding missing ones and removing stale ones."""
+        for key in list(artists):
+            if key not in wanted:
+                artists.pop(key).remove()
+        for key, (xy, text) in wanted.items():
+            if key in artists:
+                artists[key].set_text(text)
+            else:
+                artists[key] = self.ax.text(xy[0], xy[1], text, **style)
+
+    def _set_limits(self):
+        xy = np.array(list(self.pos.values())).reshape(-1, 2)
+        if len(xy) == 0:
+            self.ax.set_xlim(-1, 1)
+            self.ax.set_ylim(-1, 1)
+            return
+        span = xy.max(axis=0) - xy.min(axis=0)
+        margin = np.where(span != 0, span * 0.1, 0.1)
+        self.ax.set_xlim(xy[:, 0].min() - margin[0], xy[:, 0].max() + margin[0])
+        self.ax.set_ylim(xy[:, 1].min() - margin[1], xy[:, 1].max() + margin[1])
@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import networkx as nx
+
+from components.EventLog import load_events
+from components.Renderer import StreamingRenderer
+
+
+def iter_states(start, rounds):
+    """
+    Rebuilds the true network from an event log.
+    Yields (round, names of remaining contestants, {(name, other name): mean trust of name towards
+    other} over every relationship), first for the initial state (round 0) and then after each
+    logged round.
+    """
+    names = start["contestants"]
+    trust_mean = {
+        (names[source], names[target]): mean
+        for source, target, mean, _ in start["relationships"]
+    }
+    remaining = list(names)
+    yield 0, list(remaining), dict(trust_mean)
+    for event in rounds:
+        for a, b, delta in event["trust_deltas"]:
+            trust_mean[a, b] += delta
+        if event["evicted"] is not None:
+            remaining.remove(event["evicted"])
+        yield event["round"] + 1, list(remaining), dict(trust_mean)
+
+
+def state_at(filename, round_i):
+    """Returns (names of remaining contestants, trust_mean as in iter_states) after round `round_i`."""
+    start, rounds = load_events(filename)
+    for state_round, remaining, trust_mean in iter_states(start, rounds):
+        if state_round == round_i:
+            return remaining, trust_mean
+    raise ValueError(f"The game in {filename} has no round {round_i}")
+
+
+def edges(start):
+    """Relationships of the logged game, as (name, other name) pairs listed once each."""
+    names = start["contestants"]
+    return [
+        (names[source], names[target])
+        for source, target, _, _ in start["relationships"]
+        if source < target
+    ]
+
+
+def edge_labels(edges, remaining, trust_mean):
+    """Labels every edge between remaining contestants with their mean trust, in both directions."""
+    remaining = set(remaining)
+    return {
+        (u, v): f"{u}:{trust_mean[u, v]}, {v}:{trust_mean[v, u]}"
+        for u, v in edges
+        if u in remaining and v in remaining
+    }
+
+
+def layout(names, edges):
+    """Same layout SocialNetwork.plot uses for the graph of contestants `names` and `edges`."""
+    graph = nx.Graph()
+    graph.add_nodes_from(names)
+    graph.add_edges_from(edges)
+    return nx.spring_layout(graph, seed=42)
+
+
+def render_rounds(filename, round_indices, pos):
+    """Process pool entry point: renders the given rounds of a logged game to frames."""
+    start, rounds = load_events(filename)
+    wanted = set(round_indices)
+    relationships = edges(start)
+    renderer = StreamingRenderer(filename=None, pos=pos)
+    frames = []
+    for round_i, remaining, trust_mean in iter_states(start, rounds):
+        if round_i in wanted:
+            labels = edge_labels(relationships, remaining, trust_mean)
+            frames.append(renderer.draw(remaining, labels, round_i))
+    return frames
+
+
+def render_replay(
+    filename, animation_filename, processes=None, duration=200, chunk_size=4
+):
+    """
+    Renders every round of the event log `filename` into `animation_filename` (GIF or MP4),
+    drawing chunks of `chunk_size` rounds in parallel on a process pool.
+    Frames are appended in round order as soon as their chunk is done.
+    :return: the number of frames written
+    """
+    start, rounds = load_events(filename)
+    pos = layout(start["contestants"], edges(start))
+    round_indices = list(range(len(rounds) + 1))
+    chunks = [
+        round_indices[i : i + chunk_size]
+        for i in range(0, len(round_indices), chunk_size)
+    ]
+    writer = StreamingRenderer(animation_filename, duration=duration, pos=pos)
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for frames in executor.map(
+                render_rounds,
+                [filename] * len(chunks),
+                chunks,
+                [pos] * len(chunks),
+            ):
+                for frame in frames:
+                    writer.append(frame)
+    finally:
+        writer.close()
+    return writer.n_frames
@@ -1,19 +1,25 @@
-import matplotlib
-import networkx as nx
-
-matplotlib.use("TkAgg")
+import asyncio
 import json
-import random
+import sys
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 
-import imageio
-import matplotlib.pyplot as plt
+import networkx as nx
 import numpy as np
 
+from components import Divergence, MonteCarlo
+from components.BeliefStore import BeliefStore
+from components.Cache import LRUCache
+from components.EventLog import EventLog
 from components.InteractionHandlers import (InteractionHandler,
                                             RandomInteractionHandler)
 from components.RelationshipLink import RelationshipLink
 from components.Signals import SplitSignal
+from components.SparseTrust import SparseTrust
+from components.Topology import Topology
+from components.Tracer import Tracer, traced
+from components.TrustMatrix import TrustMatrix
 
 
 class SocialNetwork:
@@ -22,14 +28,54 @@ class SocialNetwork:
         n_interactions: int = 1,
         interaction_handler: InteractionHandler = RandomInteractionHandler(),
         names_filename=None,
+        dense_trust: bool = False,
+        verbose: bool = True,
+        mc_cache_size: int = 32,
+        tracer: Tracer = None,
+        seed=None,
+        topology: Topology = None,
+        gossip_rate: float = 0.0,
+        gossip_temperature: float = 1.0,
     ):
         # Game params
         self.n_interactions = n_interactions
+        # How far beliefs move towards those of trusted neighbours in each gossip phase
+        self.gossip_rate = gossip_rate
+        self.gossip_temperature = gossip_temperature
+        self.verbose = verbose
 
         # Game state
         self.split = False
         self.graph = nx.Graph()
         self.current_round = 0
+        # Names of the contestants who cannot be voted out, see Contestant.MC_simulate_games
+        self.immune = set()
+        # With dense_trust, relationships are views over N x N arrays instead of per-edge dicts.
+        # With a topology, only the relationships it picks exist, stored in sparse arrays.
+        self.topology = topology
+        if topology is not None:
+            if dense_trust:
+                raise ValueError(
+                    "A network with a topology always stores trust sparsely"
+                )
+            self.trust_matrix = SparseTrust()
+        else:
+            self.trust_matrix = TrustMatrix() if dense_trust else None
+        # Optional EventLog which records everything that happens in the game
+        self.event_log = None
+        # Optional BeliefStore holding the overlays of the estimated networks built on this one
+        self.belief_store = None
+        # Bumped on every change of contestants or trust, see state_fingerprint
+        self.version = 0
+        # MC results, keyed on (state_fingerprint(), query)
+        self.mc_cache = LRUCache(mc_cache_size)
+        # Optional Tracer timing the phases of the game and the strategies' choices
+        self.tracer = tracer
+        # Root of every random stream of the game, see derive_seed_sequence
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.derive_seed_sequence(0))
+        self.n_mc_calls = 0
+        self.n_spawned = 0
 
         # Game tools
         self.interaction_handler = interaction_handler
@@ -46,53 +92,181 @@ class SocialNetwork:
         self.ax = None
         self.ax_lim = None
         self.frames = []
+        self.renderer = None
+
+    def __getstate__(self):
+        # Renderers and event logs hold open files, they stay with the original network
+        state = self.__dict__.copy()
+        state["renderer"] = None
+        state["event_log"] = None
+        return state
 
+    @traced("voting_phase")
     def voting_phase(self):
         """
         Will collect votes for all contestants, and either evict a contestant or end the game if all split
         :return: The removed contestant
         """
-        sim_vote = self.simulate_vote()
+        if self.event_log is not None and self.event_log.divergence:
+            self.event_log.record_divergence(*Divergence.divergence(self))
+        return self.apply_votes(self.collect_votes())
+
+    async def voting_phase_async(self, timeout=None):
+        """voting_phase, with the votes collected concurrently, see collect_votes_async."""
+        if self.event_log is not None and self.event_log.divergence:
+            self.event_log.record_divergence(*Divergence.divergence(self))
+        return self.apply_votes(await self.collect_votes_async(timeout))
+
+    def apply_votes(self, votes):
+        """Tallies the (voter, vote) pairs of a voting phase and evicts or splits accordingly."""
+        sim_vote = self.count_votes(votes)
+        if self.event_log is not None:
+            self.event_log.record_votes(votes, sim_vote[0])
         if sim_vote[0] is SplitSignal:
             self.split = True
-            print("Splitting Money")
+            if self.verbose:
+                print("Splitting Money")
             return SplitSignal
         else:
-            print(f"Evicting {sim_vote[0]}: Count = {sim_vote[1]}")
+            if self.verbose:
+                print(f"Evicting {sim_vote[0]}: Count = {sim_vote[1]}")
             self.remove_contestant(sim_vote[0])
             return sim_vote[0]
 
+    @traced("sample_trust")
     def sample_trust(self):
         """
         Will populate the realized_trust values of all edges based on the trust_mean and trust_var values.
         """
-        for u, v, data in self.graph.edges(data=True):
-            data["relationship"].realized_trust[u.name] = random.gauss(
-                data["relationship"].trust_mean[u.name],
-                data["relationship"].trust_var[u.name],
-            )
-            data["relationship"].realized_trust[v.name] = random.gauss(
-                data["relationship"].trust_mean[v.name],
-                data["relationship"].trust_var[v.name],
-            )
+        if self.trust_matrix is not None:
+            self.trust_matrix.sample(self.rng)
+            return
+        entries = [
+            (data["relationship"], name)
+            for u, v, data in self.graph.edges(data=True)
+            for name in (u.name, v.name)
+        ]
+        realized = self.rng.normal(
+            [rel_link.trust_mean[name] for rel_link, name in entries],
+            [rel_link.trust_var[name] for rel_link, name in entries],
+        )
+        for (rel_link, name), value in zip(entries, realized.tolist()):
+            rel_link.realized_trust[name] = value
 
     def clear_realized_trust(self):
         """
-        Will populate the realized_trust values of all edges based on the trust_mean and trust_var values.
+        Will reset the realized_trust values of all edges to None.
         """
+        if self.trust_matrix is not None:
+            self.trust_matrix.clear_realized()
+            return
         for u, v, data in self.graph.edges(data=True):
             data["relationship"].realized_trust[u.name] = None
             data["relationship"].realized_trust[v.name] = None
 
+    @traced("simulate_vote")
     def simulate_vote(self):
         """
         Generates the results of a vote. No actions will be taken.
         """
+        return self.count_votes(self.collect_votes())
+
+    def collect_votes(self):
+        """
+        Samples trust and asks every contestant for their vote.
+        When every voter uses the same kind of strategy and it supports choose_batch, all votes
+        are chosen in one vectorized call (except with a topology, as that takes N x N memory).
+        :return: list of (voter, vote) pairs, in voting order
+        """
         self.sample_trust()
+        contestants = self.get_all_contestants()
+        strategy = self._batch_strategy(contestants)
+        if strategy is not None:
+            return self.collect_votes_batch(contestants, strategy)
         votes = []
-        for c in self.iter_contestants():
-            votes.append(c.get_vote())
-        count = Counter(votes)
+        tracer = self.tracer
+        for c in contestants:
+            net = self.belief_network(c)
+            if tracer is None:
+                votes.append((c, c.get_vote(net)))
+            else:
+                with tracer.span(
+                    f"{type(c.voting_strategy).__name__}.choose", "strategy"
+                ):
+                    votes.append((c, c.get_vote(net)))
+        return votes
+
+    async def collect_votes_async(self, timeout=None):
+        """
+        collect_votes for voters whose strategies wait on agent backends: every contestant is
+        asked at once, with VotingStrategy.choose_async, so the phase takes as long as the
+        slowest voter rather than the sum of all of them. A voter who does not answer within
+        `timeout` seconds splits. Votes which collect_votes would choose in one vectorized call
+        still are, so strategies which do not wait vote exactly as in collect_votes.
+        """
+        self.sample_trust()
+        contestants = self.get_all_contestants()
+        strategy = self._batch_strategy(contestants)
+        if strategy is not None:
+            return self.collect_votes_batch(contestants, strategy)
+        tracer = self.tracer
+        with (
+            nullcontext()
+            if tracer is None
+            else tracer.span("collect_votes_async", "strategy")
+        ):
+            votes = await _gather_with_timeout(
+                [c.get_vote_async(self.belief_network(c)) for c in contestants],
+                timeout,
+                SplitSignal,
+            )
+        return list(zip(contestants, votes))
+
+    def _batch_strategy(self, contestants):
+        """The strategy of every voter if it supports choose_batch, else None."""
+        strategy = contestants[0].voting_strategy if contestants else None
+        if (
+            strategy is not None
+            and self.topology is None
+            and strategy.supports_batch
+            and all(type(c.voting_strategy) is type(strategy) for c in contestants)
+        ):
+            return strategy
+        return None
+
+    def collect_votes_batch(self, contestants, strategy):
+        voters, trust = self.voting_trust()
+        immune = np.array([self.is_immune(c) for c in voters], dtype=bool)
+        tracer = self.tracer
+        with (
+            nullcontext()
+            if tracer is None
+            else tracer.span(f"{type(strategy).__name__}.choose_batch", "strategy")
+        ):
+            votes = strategy.choose_batch(voters, trust, immune, self.rng)
+        return list(zip(contestants, votes))
+
+    def voting_trust(self):
+        """
+        Returns (contestants, trust), where trust[i, j] is the trust contestants[i] acts on towards
+        contestants[j] when voting: according to their belief network, the mean where the variance
+        is 0 and the realized trust otherwise. It is infinite towards yourself and contestants
+        you have no relationship with.
+        """
+        contestants = self.get_all_contestants()
+        index = {c: i for i, c in enumerate(contestants)}
+        trust = np.full((len(contestants), len(contestants)), np.inf)
+        for i, c in enumerate(contestants):
+            for neighbour, t in self.belief_network(c).true_trust(c).items():
+                trust[i, index[neighbour]] = t
+        return contestants, trust
+
+    def count_votes(self, votes):
+        """
+        Tallies (voter, vote) pairs.
+        :return: (SplitSignal, None) if everyone split, else (evicted contestant, Counter of votes)
+        """
+        count = Counter(vote for _, vote in votes)
         if len(count.keys()) == 1 and list(count.keys())[0] == SplitSignal:
             self.split = True
             return SplitSignal, None
@@ -102,19 +276,299 @@ class SocialNetwork:
             evicted = count.most_common(1)[0][0]
             return evicted, count
 
+    @traced("interaction_phase")
     def interaction_phase(self):
         """
         each agent can attempt self.n_interactions interactions
         """
         interactions = []
+        tracer = self.tracer
         for c in self.iter_contestants():
-            interactions.append(c.get_interaction(self))
-        for interaction in interactions:
-            if self.interaction_handler.get_interaction_success(self, interaction):
+            for _ in range(self.n_interactions):
+                if tracer is None:
+                    interactions.append(c.get_interaction(self))
+                else:
+                    with tracer.span(
+                        f"{type(c.interaction_strategy).__name__}.choose", "strategy"
+                    ):
+                        interactions.append(c.get_interaction(self))
+        self.resolve_interactions(interactions)
+
+    async def interaction_phase_async(self, timeout=None):
+        """
+        interaction_phase for contestants whose strategies wait on agent backends: every
+        interaction of the phase is chosen at once, with InteractionStrategy.choose_async. A
+        contestant who does not answer within `timeout` seconds does not interact.
+        """
+        tracer = self.tracer
+        with (
+            nullcontext() if tracer is None else tracer.span("interaction_phase_async")
+        ):
+            interactions = await _gather_with_timeout(
+                [
+                    c.get_interaction_async(self)
+                    for c in self.iter_contestants()
+                    for _ in range(self.n_interactions)
+                ],
+                timeout,
+                None,
+            )
+            self.resolve_interactions(interactions)
+
+    def resolve_interactions(self, interactions):
+        """Draws the success of the chosen interactions (None for no interaction) and applies them."""
+        # Contestants without neighbours have nobody to interact with
+        interactions = [i for i in interactions if i is not None]
+        successes = self.interaction_handler.get_interaction_successes(
+            self, interactions
+        )
+        for interaction, success in zip(interactions, successes):
+            if self.event_log is not None:
+                self.event_log.record_interaction(interaction, success)
+            if success:
                 interaction.success(self)
             else:
                 interaction.failure(self)
 
+    @traced("gossip_phase")
+    def gossip_phase(self):
+        """
+        Contestants tell their neighbours what they know about trust. Each contestant's beliefs
+        (the mean trusts of their estimated social network) move a fraction gossip_rate towards
+        the average beliefs of their neighbours, weighted by a softmax of how much they trust
+        them (at gossip_temperature). Beliefs about one's own trust are never changed.
+        Only the belief entries which a contestant or one of their neighbours knows to differ
+        from their base are updated: the overlay entries of every neighbour are scattered along
+        the relationships of the network, so that the cost is linear in their number.
+        """
+        contestants = self.get_all_contestants()
+        if self.gossip_rate == 0 or len(contestants) < 2:
+            return
+        n = len(contestants)
+        names = [c.name for c in contestants]
+        networks = [c.estimated_social_network for c in contestants]
+
+        # Overlay entries of every network, sorted by owner and then by entry (a * n + b)
+        bases, lookups = {}, []
+        owners, keys, values = [], [], []
+        for k, estimated in enumerate(networks):
+            if id(estimated.base) not in bases:
+                bases[id(estimated.base)] = len(lookups)
+                base_contestants, index, sources, targets, entries = (
+                    estimated.base_entries()
+                )
+                ids = np.array([index[name] for name in names], dtype=int)
+                to_position = np.full(len(base_contestants), -1)
+                to_position[ids] = np.arange(n)
+                lookups.append(
+                    (ids, to_position, sources, targets, entries["trust_mean"])
+                )
+            to_position = lookups[bases[id(estimated.base)]][1]
+            sources, targets, overlay = estimated.overlay_arrays("trust_mean")
+            a, b = to_position[sources], to_position[targets]
+            present = (a >= 0) & (b >= 0)
+            owners.append(np.full(present.sum(), k))
+            keys.append(a[present] * n + b[present])
+            values.append(overlay[present])
+        owners, keys, values = map(np.concatenate, (owners, keys, values))
+        if len(keys) == 0:
+            return
+        order = np.lexsort((keys, owners))
+        owners, keys, values = owners[order], keys[order], values[order]
+        held = np.bincount(owners, minlength=n)
+        overlay_indptr = np.concatenate([[0], np.cumsum(held)])
+        # pair_base[g, p] is the value in base g of the p-th entry held by any network
+        pairs, pair_of = np.unique(keys, return_inverse=True)
+        pair_base = np.empty((len(lookups), len(pairs)))
+        for g, (ids, to_position, sources, targets, trust_mean) in enumerate(lookups):
+            a, b = np.divmod(pairs, n)
+            size = len(to_position)
+            pair_base[g] = trust_mean[
+                np.searchsorted(sources * size + targets, ids[a] * size + ids[b])
+            ]
+        of_base = np.array([bases[id(estimated.base)] for estimated in networks])
+        deltas = values - pair_base[of_base[owners], pair_of]
+
+        # weights[e] is how much contestant sources[e] listens to their neighbour targets[e]
+        _, sources, targets, trust_mean, _ = self.trust_entries()
+        indptr = np.searchsorted(sources, np.arange(n + 1))
+        degree = np.diff(indptr)
+        listeners = np.flatnonzero(degree)
+        logits = trust_mean / self.gossip_temperature
+        highest = np.zeros(n)
+        highest[listeners] = np.maximum.reduceat(logits, indptr[listeners])
+        weights = np.exp(logits - highest[sources])
+        totals = np.ones(n)
+        totals[listeners] = np.add.reduceat(weights, indptr[listeners])
+        weights /= totals[sources]
+        rate = np.where(degree > 0, self.gossip_rate, 0.0)
+        # base_weights[i, g] is how much contestant i listens to neighbours on base g
+        base_weights = np.zeros((n, len(lookups)))
+        np.add.at(base_weights, (sources, of_base[targets]), weights)
+
+        # Contestants are gossiped to in chunks of rows, each hearing the overlays of their
+        # neighbours; cells (row in chunk) * len(pairs) + pair are the entries updated
+        heard_ends = np.concatenate([[0], np.cumsum(held[targets])])
+        lengths = heard_ends[indptr[1:]] - heard_ends[indptr[:-1]] + held
+        ends = np.cumsum(lengths)
+        start = 0
+        while start < n:
+            stop = max(
+                start + 1,
+                np.searchsorted(
+                    ends,
+                    ends[start] - lengths[start] + MonteCarlo.MAX_CHUNK_ENTRIES,
+                    "right",
+                ),
+            )
+            edges = np.arange(indptr[start], indptr[stop])
+            counts = held[targets[edges]]
+            edge_of = np.repeat(edges, counts)
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            heard = overlay_indptr[targets[edge_of]] + (
+                np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+            )
+            own = np.arange(overlay_indptr[start], overlay_indptr[stop])
+            cells, neighbours, own_cells = _grouped_sums(
+                (sources[edge_of] - start) * len(pairs) + pair_of[heard],
+                weights[edge_of] * deltas[heard],
+                (owners[own] - start) * len(pairs) + pair_of[own],
+                (stop - start) * len(pairs),
+            )
+            listener, pair = np.divmod(cells, len(pairs))
+            listener += start
+            own_base = pair_base[of_base[listener], pair]
+            beliefs = own_base.copy()
+            beliefs[own_cells] = values[own]
+            neighbours += (base_weights[listener] * pair_base[:, pair].T).sum(axis=1)
+            gossiped = (1 - rate[listener]) * beliefs + rate[listener] * neighbours
+            own_trust = pairs[pair] // n == listener
+            gossiped[own_trust] = beliefs[own_trust]
+
+            rows = np.searchsorted(listener, np.arange(start, stop + 1))
+            for k in range(start, stop):
+                row = slice(rows[k - start], rows[k - start + 1])
+                if row.start == row.stop:
+                    continue
+                a, b = np.divmod(pairs[pair[row]], n)
+                networks[k].update_trust(
+                    "trust_mean",
+                    [(names[i], names[j]) for i, j in zip(a.tolist(), b.tolist())],
+                    gossiped[row],
+                    own_base[row],
+                )
+            start = stop
+
+    def change_trust(self, a, b, delta):
+        """Changes the mean trust of contestant a towards contestant b by delta."""
+        self.get_relationship(a, b).trust_mean[a.name] += delta
+        self.version += 1
+        if self.event_log is not None:
+            self.event_log.record_trust_delta(a, b, delta)
+
+    @traced("MC_simulate_all")
+    def MC_simulate_all(self, n=100, processes=None, seed=None, executor=None):
+        """
+        Runs `n` MC simulations on every contestant's estimated social network, spread over a
+        process pool of `processes` workers (all cores if None, inline if 1), or over `executor`
+        when given, so that one pool can be kept alive across rounds.
+        Only trust arrays (or entries, with a topology) are shipped to the workers. Each contestant gets its own random stream
+        spawned from `seed` (or, if None, from the network's own seed and a call counter), so
+        results do not depend on the number of workers.
+        Contestants whose estimated network did not change since the same query are served from
+        their MC cache.
+        :return: dict of contestant -> result of MC_simulate_games
+        """
+        contestants, results, jobs, unbatched = self._MC_simulate_all_jobs(n, seed)
+        for c, (rng, cache_key) in unbatched.items():
+            results[c] = c.MC_simulate_games(n, use_cache=False, rng=rng)
+            c.estimated_social_network.mc_cache.put(cache_key, results[c])
+        if not jobs or (processes == 1 and executor is None):
+            evictions = [MonteCarlo.simulate_state(*job) for job, _ in jobs.values()]
+        else:
+            pool = (
+                ProcessPoolExecutor(max_workers=processes)
+                if executor is None
+                else nullcontext(executor)
+            )
+            with pool as pool:
+                evictions = list(
+                    pool.map(
+                        MonteCarlo.simulate_state,
+                        *zip(*(job for job, _ in jobs.values())),
+                    )
+                )
+        return self._MC_simulate_all_results(contestants, results, jobs, evictions)
+
+    async def MC_simulate_all_async(self, n=100, seed=None, timeout=None):
+        """
+        MC_simulate_all for contestants whose simulated voters wait on agent backends: the
+        estimated networks which do not support the batched engine are all simulated at once with
+        Contestant.MC_simulate_games_async, so the simulated votes of every contestant are sent to
+        each backend in common batches. A simulated voter who does not answer within `timeout`
+        seconds splits. Batched simulations run inline, with the same streams as MC_simulate_all.
+        :return: dict of contestant -> result of MC_simulate_games
+        """
+        tracer = self.tracer
+        with nullcontext() if tracer is None else tracer.span("MC_simulate_all_async"):
+            contestants, results, jobs, unbatched = self._MC_simulate_all_jobs(n, seed)
+            simulated = await asyncio.gather(
+                *(
+                    c.MC_simulate_games_async(
+                        n, use_cache=False, rng=rng, timeout=timeout
+                    )
+                    for c, (rng, _) in unbatched.items()
+                )
+            )
+            for (c, (_, cache_key)), result in zip(unbatched.items(), simulated):
+                results[c] = result
+                c.estimated_social_network.mc_cache.put(cache_key, result)
+            evictions = [MonteCarlo.simulate_state(*job) for job, _ in jobs.values()]
+            return self._MC_simulate_all_results(contestants, results, jobs, evictions)
+
+    def _MC_simulate_all_jobs(self, n, seed):
+        """
+        Splits the MC simulations of MC_simulate_all between cached results, batched jobs and
+        estimated networks to simulate game by game, each with its own random stream.
+        :return: (contestants, {contestant: cached result}, {contestant: (simulate_state args,
+            cache key)}, {contestant: (Generator, cache key)})
+        """
+        contestants = self.get_all_contestants()
+        if seed is None:
+            root = self.derive_seed_sequence(1, self.n_mc_calls)
+            self.n_mc_calls += 1
+        else:
+            root = np.random.SeedSequence(seed)
+        seeds = root.spawn(len(contestants))
+        results = {}
+        jobs = {}
+        unbatched = {}
+        for i, (c, seed_sequence) in enumerate(zip(contestants, seeds)):
+            estimated = c.estimated_social_network
+            cache_key = (estimated.state_fingerprint(), ("MC_simulate_all", n, seed, i))
+            if cache_key in estimated.mc_cache:
+                results[c] = estimated.mc_cache.get(cache_key)
+            elif MonteCarlo.batch_supported(estimated):
+                jobs[c] = (
+                    MonteCarlo.batch_state(estimated),
+                    n,
+                    seed_sequence,
+                ), cache_key
+            else:
+                unbatched[c] = np.random.default_rng(seed_sequence), cache_key
+        return contestants, results, jobs, unbatched
+
+    @staticmethod
+    def _MC_simulate_all_results(contestants, results, jobs, evictions):
+        for (c, (_, cache_key)), c_evictions in zip(jobs.items(), evictions):
+            estimated = c.estimated_social_network
+            results[c] = MonteCarlo.eviction_distribution(
+                c_evictions, estimated.get_all_contestants()
+            )
+            estimated.mc_cache.put(cache_key, results[c])
+        return {c: results[c] for c in contestants}
+
+    @traced("voting_outcome_reaction_phase")
     def voting_outcome_reaction_phase(self, outcome):
         """
         Agents react to the previous vote, and adjust their internal parameters.
@@ -133,6 +587,74 @@ class SocialNetwork:
         """Returns a list of all contestants in the network."""
         return list(self.graph.nodes)
 
+    def state_fingerprint(self):
+        """
+        Cheap fingerprint of the contestants and trust of the network, which changes whenever they do.
+        Edits made directly to the dicts of a RelationshipLink (without dense_trust) are not tracked,
+        so they must be followed by `self.version += 1`.
+        """
+        if self.trust_matrix is not None:
+            return self.version, self.trust_matrix.version
+        return (self.version,)
+
+    def derive_seed_sequence(self, *key):
+        """
+        Returns the seed sequence of the independent random stream `key` (a tuple of ints) of
+        this network. The same root seed and key always give the same stream:
+        key (0,) is self.rng, (1, i) the i-th MC_simulate_all and (2, i) the i-th spawned network.
+        """
+        return np.random.SeedSequence(
+            self.seed_sequence.entropy, spawn_key=self.seed_sequence.spawn_key + key
+        )
+
+    def spawn_seed_sequence(self):
+        """Seed sequence for the next network derived from this one, such as an estimated network."""
+        seed_sequence = self.derive_seed_sequence(2, self.n_spawned)
+        self.n_spawned += 1
+        return seed_sequence
+
+    def cached_MC(self, query, simulate):
+        """
+        Returns the cached MC result for `query` at the current state of the network,
+        or runs `simulate()` and caches its result.
+        """
+        key = (self.state_fingerprint(), query)
+        result = self.mc_cache.get(key)
+        if result is None:
+            result = simulate()
+            self.mc_cache.put(key, result)
+        return result
+
+    def neighbours(self, contestant):
+        """Returns a list of the contestants which have a relationship with `contestant`."""
+        return list(self.graph[contestant])
+
+    def is_immune(self, contestant):
+        """Whether `contestant` cannot be voted out in the game played on this network."""
+        return contestant.name in self.immune
+
+    def belief_network(self, contestant):
+        """Returns the network whose beliefs `contestant` acts on: in the true network, their own estimate."""
+        return contestant.estimated_social_network
+
+    def true_trust(self, contestant):
+        """Returns a dict of neighbour -> trust of `contestant` towards that neighbour in this network."""
+        if self.trust_matrix is not None:
+            return self.trust_matrix.true_trust(contestant)
+        trust_neighbours = {}
+        for neighbour, data in self.graph[contestant].items():
+            if data["relationship"].trust_var[contestant.name] == 0:
+                trust_neighbours[neighbour] = data["relationship"].trust_mean[
+                    contestant.name
+                ]
+            else:
+                r_t = data["relationship"].realized_trust[contestant.name]
+                assert (
+                    r_t is not None
+                ), "If trust variance > 0, realized trust must exist"
+                trust_neighbours[neighbour] = r_t
+        return trust_neighbours
+
     def get_next_name(self):
         if self.available_names:
             return self.available_names.pop(0)
@@ -144,18 +666,98 @@ class SocialNetwork:
             next_name = self.get_next_name()
             if next_name:
                 contestant.name = next_name
+        if self.topology is not None:
+            self._add_linked_contestant(contestant)
+            return
         self.graph.add_node(contestant)
+        self.version += 1
+        if self.trust_matrix is not None:
+            self.trust_matrix.add(contestant)
         for other in self.graph.nodes:
             if other != contestant and not self.graph.has_edge(contestant, other):
-                rel_link = RelationshipLink(contestant, other)
+                rel_link = RelationshipLink(contestant, other, self.trust_matrix)
                 self.graph.add_edge(contestant, other, relationship=rel_link)
 
+    def _add_linked_contestant(self, contestant):
+        """Adds a contestant with only the relationships picked by the topology."""
+        links = self.topology.links(self.trust_matrix, contestant, self.rng)
+        self.graph.add_node(contestant)
+        self.version += 1
+        self.trust_matrix.add(contestant)
+        for j in links:
+            other = self.trust_matrix.contestants[j]
+            if not self.graph.has_edge(contestant, other):
+                self.trust_matrix.link(contestant, other)
+                self.graph.add_edge(contestant, other)
+
     def remove_contestant(self, contestant):
         if self.graph.has_node(contestant):
             self.graph.remove_node(contestant)
+            self.version += 1
+            if self.trust_matrix is not None:
+                self.trust_matrix.remove(contestant)
         else:
             raise ValueError(f"WARNING: There is no contestant {contestant}")
 
+    def get_relationship(self, a, b):
+        """Returns the RelationshipLink between contestants a and b."""
+        if self.topology is not None:
+            # Sparse relationships are only stored as arrays, links are views made on demand
+            return RelationshipLink(a, b, self.trust_matrix)
+        return self.graph.get_edge_data(a, b)["relationship"]
+
+    def trust_arrays(self):
+        """
+        Returns (contestants, trust_mean, trust_var), where the arrays are N x N and entry [i, j]
+        is the trust of contestants[i] towards contestants[j]. Contestants are in iteration order.
+        Networks with a topology only have trust_entries, as these arrays would take N x N memory.
+        """
+        if self.topology is not None:
+            raise ValueError(
+                "A network with a topology has no dense trust arrays: use trust_entries"
+            )
+        contestants = self.get_all_contestants()
+        if self.trust_matrix is not None:
+            ids = np.array([self.trust_matrix.index(c) for c in contestants], dtype=int)
+            return (contestants, *self.trust_matrix.arrays(ids))
+        index = {c: i for i, c in enumerate(contestants)}
+        trust_mean = np.zeros((len(contestants), len(contestants)))
+        trust_var = np.zeros((len(contestants), len(contestants)))
+        for u, v, data in self.graph.edges(data=True):
+            rel_link = data["relationship"]
+            for a, b in ((u, v), (v, u)):
+                trust_mean[index[a], index[b]] = rel_link.trust_mean[a.name]
+                trust_var[index[a], index[b]] = rel_link.trust_var[a.name]
+        return contestants, trust_mean, trust_var
+
+    def trust_entries(self):
+        """
+        Returns (contestants, sources, targets, trust_mean, trust_var) with one entry per directed
+        relationship, sorted by source and then target, where sources and targets are positions in
+        contestants (in iteration order). Memory is linear in the number of relationships.
+        """
+        if self.topology is None:
+            contestants, trust_mean, trust_var = self.trust_arrays()
+            sources, targets = np.nonzero(~np.eye(len(contestants), dtype=bool))
+            return (
+                contestants,
+                sources,
+                targets,
+                trust_mean[sources, targets],
+                trust_var[sources, targets],
+            )
+        contestants = self.get_all_contestants()
+        ids = np.array([self.trust_matrix.index(c) for c in contestants], dtype=int)
+        sources, targets, trust_mean, trust_var = self.trust_matrix.entries(ids)
+        order = np.lexsort((targets, sources))
+        return (
+            contestants,
+            sources[order],
+            targets[order],
+            trust_mean[order],
+            trust_var[order],
+        )
+
     def capture_frame(self):
         """Capture the current figure canvas as an RGB image and store it."""
         # Ensure the canvas is drawn.
@@ -167,13 +769,53 @@ class SocialNetwork:
         img = img[..., :3]
         self.frames.append(img)
 
+    def log_events_to(self, filename="events.jsonl", divergence=False):
+        """
+        Starts writing a compact per-round EventLog of the game to `filename`, which
+        replay.py can render offline. Call this once all contestants have been added.
+        With divergence=True, every round also logs how far each contestant's estimated
+        network is from the true one (see Divergence.divergence).
+        """
+        self.event_log = EventLog(filename, self, divergence)
+
+    def store_beliefs_in(self, filename="beliefs.f32"):
+        """
+        Keeps the beliefs of the estimated social networks which use this network as their base
+        in a memory-mapped BeliefStore file, instead of dicts in memory. Call this on the base,
+        once all contestants have been added and before any estimated network is generated.
+        Belief stores are not saved in checkpoints: restored overlays are held in dicts.
+        Networks with a topology cannot use one, as blocks hold N x N beliefs.
+        """
+        if self.topology is not None:
+            raise ValueError("A network with a topology cannot use a BeliefStore")
+        self.belief_store = BeliefStore(
+            filename, [c.name for c in self.get_all_contestants()]
+        )
+
+    def record_to(self, filename="animation.gif", duration=200):
+        """
+        Switches plotting to headless mode: every subsequent plot() is rendered off-screen and
+        streamed straight into `filename` (GIF, or MP4 with imageio-ffmpeg) instead of self.frames.
+        """
+        from components.Renderer import StreamingRenderer
+
+        self.renderer = StreamingRenderer(filename, duration=duration)
+
+    @traced("plot")
     def plot(self, fixed=True, record=True):
         """
         Updates the persistent plot non-blockingly in a single window.
         The axes limits never shrink: once set, they only expand if new node positions require it.
         Displays a title "A Game of Trust - Round i" (where i increments each time this function is called)
         and captures the frame if record=True.
+        In headless mode (see record_to), the frame is streamed to the renderer's file instead.
         """
+        if self.renderer is not None:
+            self.current_round += 1
+            self.renderer.render(self, self.current_round)
+            return
+
+        plt = _pyplot()
         # Create persistent figure and axes if they don't exist or have been closed.
         if self.fig is None or not plt.fignum_exists(self.fig.number):
             self.fig, self.ax = plt.subplots(figsize=(10, 8))
@@ -205,8 +847,8 @@ class SocialNetwork:
 
         # Annotate edges with trust values.
         edge_labels = {}
-        for u, v, data in self.graph.edges(data=True):
-            rel_link = data["relationship"]
+        for u, v in self.graph.edges():
+            rel_link = self.get_relationship(u, v)
             trust_str = ", ".join(
                 [f"{name}:{val}" for name, val in rel_link.realized_trust.items()]
             )
@@ -255,13 +897,64 @@ class SocialNetwork:
         if record:
             self.capture_frame()
 
+    @traced("save_animation_as_gif")
     def save_animation_as_gif(self, filename="animation.gif", duration=200):
         """
         Save the recorded frames as an animated GIF.
         Make sure that recording has been enabled during plotting (record=True).
+        In headless mode, this finalizes the file which frames were streamed to.
         """
-        if self.frames:
+        if self.renderer is not None:
+            self.renderer.close()
+            print(f"Animation saved as {self.renderer.filename}")
+        elif self.frames:
+            import imageio
+
             imageio.mimsave(filename, self.frames, duration=duration)
             print(f"Animation saved as {filename}")
         else:
             print("No frames were recorded; animation not saved.")
+
+
+def _grouped_sums(cells, weights, extra, size):
+    """
+    Sums `weights` over equal `cells` (all below `size`). Returns the sorted distinct cells of
+    `cells` and `extra`, their sums (0 for cells only in `extra`) and the positions of `extra`
+    among them. Cells are counted in a table of `size` when it is no larger than they are, and
+    sorted otherwise.
+    """
+    if size <= len(cells):
+        seen = np.bincount(cells, minlength=size)
+        seen[extra] += 1
+        distinct = np.flatnonzero(seen)
+        sums = np.bincount(cells, weights, minlength=size)[distinct]
+        return distinct, sums, np.searchsorted(distinct, extra)
+    distinct, inverse = np.unique(np.concatenate([cells, extra]), return_inverse=True)
+    sums = np.bincount(inverse[: len(cells)], weights, minlength=len(distinct))
+    return distinct, sums, inverse[len(cells) :]
+
+
+def _pyplot():
+    """
+    Imports pyplot (with the interactive TkAgg backend, unless pyplot was already imported) on
+    first use, so that the simulation core can be imported without any plotting dependency.
+    """
+    if "matplotlib.pyplot" not in sys.modules:
+        import matplotlib
+
+        matplotlib.use("TkAgg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+async def _gather_with_timeout(calls, timeout, default):
+    """Awaits the coroutines `calls` concurrently, each returning `default` after `timeout` seconds."""
+
+    async def call(coroutine):
+        try:
+            return await asyncio.wait_for(coroutine, timeout)
+        except asyncio.TimeoutError:
+            return default
+
+    return await asyncio.gather(*(call(coroutine) for coroutine in calls))
@@ -0,0 +1,146 @@
+import numpy as np
+
+
+class SparseTrust:
+    """
+    Sparse storage for the trust values of a SocialNetwork whose relationship graph is not complete.
+    Each relationship holds two entries, one per direction, in flat arrays in the order they were
+    linked. A CSR index over the entries (sorted by source, then target id) is rebuilt lazily after
+    new relationships are linked, so the row of a contestant is a slice and finding an entry is a
+    binary search. Memory is linear in the number of relationships. Unrealized trust is NaN.
+    """
+
+    def __init__(self, capacity=8, entry_capacity=64):
+        self.ids = {}
+        self.contestants = []
+        self.active = np.zeros(capacity, dtype=bool)
+        self.source = np.zeros(entry_capacity, dtype=np.int64)
+        self.target = np.zeros(entry_capacity, dtype=np.int64)
+        self.trust_mean = np.zeros(entry_capacity)
+        self.trust_var = np.zeros(entry_capacity)
+        self.realized_trust = np.full(entry_capacity, np.nan)
+        self.n_entries = 0
+        # Bumped by every write to trust_mean or trust_var through a TrustView
+        self.version = 0
+        # CSR index: entries indptr[i]:indptr[i + 1] of `order` have source i, sorted by target
+        self.indptr = None
+        self.order = None
+        self.targets = None
+
+    @property
+    def size(self):
+        """Number of ids handed out so far (including removed contestants)."""
+        return len(self.contestants)
+
+    def add(self, contestant):
+        if contestant.name in self.ids:
+            raise ValueError(f"Contestant {contestant} already has a trust id")
+        if self.size == len(self.active):
+            self.active = np.concatenate(
+                [self.active, np.zeros(len(self.active), dtype=bool)]
+            )
+        idx = self.size
+        self.ids[contestant.name] = idx
+        self.contestants.append(contestant)
+        self.active[idx] = True
+        self.indptr = None
+        return idx
+
+    def remove(self, contestant):
+        """Ids are never reused, the contestant is simply deactivated."""
+        self.active[self.ids[contestant.name]] = False
+
+    def index(self, contestant):
+        return self.ids[contestant.name]
+
+    def link(self, contestant1, contestant2):
+        """Adds the two entries of a relationship, with zero trust and variance."""
+        if self.n_entries + 2 > len(self.source):
+            self._grow(2 * len(self.source))
+        i, j = self.index(contestant1), self.index(contestant2)
+        n = self.n_entries
+        self.source[n : n + 2] = (i, j)
+        self.target[n : n + 2] = (j, i)
+        self.n_entries += 2
+        self.indptr = None
+
+    def cell(self, name, other_name):
+        """Entry holding the trust of `name` towards `other_name`."""
+        i, j = self.ids[name], self.ids[other_name]
+        targets, entries = self.row(i)
+        k = np.searchsorted(targets, j)
+        if k == len(targets) or targets[k] != j:
+            raise KeyError(f"There is no relationship between {name} and {other_name}")
+        return entries[k]
+
+    def row(self, i):
+        """Returns (target ids, entries) of the relationships of contestant id `i`, by target id."""
+        if self.indptr is None:
+            self._build_index()
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        return self.targets[start:stop], self.order[start:stop]
+
+    def sample(self, rng):
+        """Draws every realized trust value from its Gaussian in one vectorized call on `rng`."""
+        n = self.n_entries
+        self.realized_trust[:n] = rng.normal(self.trust_mean[:n], self.trust_var[:n])
+
+    def clear_realized(self):
+        self.realized_trust[:] = np.nan
+
+    def true_trust(self, contestant):
+        """
+        Returns a dict of neighbour -> trust of `contestant` towards that neighbour, using the
+        mean where the variance is 0 and the realized trust otherwise.
+        """
+        targets, entries = self.row(self.index(contestant))
+        keep = self.active[targets]
+        targets, entries = targets[keep], entries[keep]
+        trust = np.where(
+            self.trust_var[entries] == 0,
+            self.trust_mean[entries],
+            self.realized_trust[entries],
+        )
+        assert not np.isnan(
+            trust
+        ).any(), "If trust variance > 0, realized trust must exist"
+        return {self.contestants[j]: t for j, t in zip(targets, trust.tolist())}
+
+    def entries(self, ids):
+        """
+        Returns (sources, targets, trust_mean, trust_var) of the relationships between the
+        contestant ids `ids`, with sources and targets as positions in `ids`.
+        """
+        position = np.full(self.size, -1)
+        position[ids] = np.arange(len(ids))
+        n = self.n_entries
+        sources, targets = position[self.source[:n]], position[self.target[:n]]
+        keep = (sources >= 0) & (targets >= 0)
+        return (
+            sources[keep],
+            targets[keep],
+            self.trust_mean[:n][keep],
+            self.trust_var[:n][keep],
+        )
+
+    def _build_index(self):
+        n = self.n_entries
+        self.order = np.lexsort((self.target[:n], self.source[:n]))
+        self.targets = self.target[self.order]
+        self.indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(self.source[:n], minlength=self.size), out=self.indptr[1:]
+        )
+
+    def _grow(self, capacity):
+        n = self.n_entries
+        for field, fill, dtype in (
+            ("source", 0, np.int64),
+            ("target", 0, np.int64),
+            ("trust_mean", 0.0, float),
+            ("trust_var", 0.0, float),
+            ("realized_trust", np.nan, float),
+        ):
+            grown = np.full(capacity, fill, dtype=dtype)
+            grown[:n] = getattr(self, field)[:n]
+            setattr(self, field, grown)
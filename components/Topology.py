@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class Topology:
+    """
+    Decides which relationships a contestant joining a SocialNetwork gets. A network with a
+    topology stores its trust in a SparseTrust, so memory grows with the number of relationships.
+    """
+
+    def links(self, trust, contestant, rng):
+        """
+        Returns the ids (in the SparseTrust `trust`) of the contestants already in the network which
+        `contestant` gets a relationship with.
+        """
+        raise Exception("This function should be overwritten by derived class!")
+
+
+class CompleteTopology(Topology):
+    """Everyone has a relationship with everyone, as in a network without a topology."""
+
+    def links(self, trust, contestant, rng):
+        return np.flatnonzero(trust.active[: trust.size]).tolist()
+
+
+class KNearestTopology(Topology):
+    """
+    Contestants are placed on a line in the order they join, and have a relationship with the `k`
+    nearest ones: the k // 2 who joined just before them and the k // 2 who join just after.
+    """
+
+    def __init__(self, k=4):
+        self.k = k
+
+    def links(self, trust, contestant, rng):
+        return [
+            j
+            for j in range(max(0, trust.size - self.k // 2), trust.size)
+            if trust.active[j]
+        ]
+
+
+class SmallWorldTopology(KNearestTopology):
+    """
+    Watts-Strogatz style graph: the k-nearest relationships, each of which is rewired with
+    probability `p` to a uniformly random contestant who joined earlier.
+    """
+
+    def __init__(self, k=4, p=0.1):
+        super().__init__(k)
+        self.p = p
+
+    def links(self, trust, contestant, rng):
+        nearest = super().links(trust, contestant, rng)
+        rewired = rng.random(len(nearest)) < self.p
+        others = rng.integers(0, max(1, trust.size), len(nearest))
+        links = []
+        for j, rewire, other in zip(nearest, rewired, others.tolist()):
+            if rewire and trust.active[other] and other not in links:
+                j = other
+            if j not in links:
+                links.append(j)
+        return links
+
+
+class ExplicitTopology(Topology):
+    """
+    Relationships given as an adjacency: a dict of name -> names of neighbours, or a list of
+    (name, name) pairs. Relationships are undirected, so each only needs to be listed once.
+    A joining contestant is linked in the order their relationships are listed.
+    """
+
+    def __init__(self, adjacency):
+        pairs = (
+            [(a, b) for a, neighbours in adjacency.items() for b in neighbours]
+            if isinstance(adjacency, dict)
+            else adjacency
+        )
+        # name -> {neighbour name: None}, a set which keeps the listed order
+        self.adjacency = {}
+        for a, b in pairs:
+            self.adjacency.setdefault(a, {})[b] = None
+            self.adjacency.setdefault(b, {})[a] = None
+
+    def links(self, trust, contestant, rng):
+        return [
+            trust.ids[name]
+            for name in self.adjacency.get(contestant.name, ())
+            if name in trust.ids and trust.active[trust.ids[name]]
+        ]
@@ -0,0 +1,358 @@
+import csv
+import itertools
+import os
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                as_completed, wait)
+from contextlib import nullcontext
+
+import numpy as np
+
+from components import Divergence
+from components.Checkpoint import (checkpoint_exists, load_checkpoint,
+                                   save_checkpoint)
+from components.Contestant import Contestant
+from components.EstimatedSocialNetwork import FrozenSocialNetwork
+from components.InteractionHandlers import RandomInteractionHandler
+from components.InteractionStrategies import (LookaheadInteractionChoice,
+                                              RandomInteractionChoice)
+from components.SocialNetwork import SocialNetwork
+from components.Traits import ImmutableTraits
+from components.VotingStrategies import RandomVoteChoice, TrustVoteChoice
+
+VOTING_STRATEGIES = {"trust": TrustVoteChoice, "random": RandomVoteChoice}
+INTERACTION_STRATEGIES = {
+    "random": RandomInteractionChoice,
+    "lookahead": LookaheadInteractionChoice,
+}
+
+# Parameters which can be swept over, with their defaults
+DEFAULT_CONFIG = {
+    "n_contestants": 5,
+    "strategy_mix": "trust",
+    "interaction_strategy": "random",
+    "trust_threshold": -1,
+    "success_prob": 0.75,
+    "n_interactions": 1,
+    "gossip_rate": 0.0,
+    "mc_trials": 0,
+}
+
+OUTCOME_COLUMNS = [
+    "game_id",
+    "seed",
+    *DEFAULT_CONFIG,
+    "n_rounds",
+    "split_round",
+    "eviction_order",
+    "remaining",
+    "trust_mean",
+    "trust_std",
+    "trust_min",
+    "trust_max",
+    *(f"belief_{metric}" for metric in Divergence.METRICS),
+]
+
+
+def parse_strategy_mix(strategy_mix):
+    """
+    Parses a voting strategy mix such as "trust" or "trust=3,random=1" into {name: probability}.
+    """
+    weights = {}
+    for part in strategy_mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in VOTING_STRATEGIES:
+            raise ValueError(f"Unknown voting strategy {name!r}")
+        weights[name] = float(weight) if weight else 1.0
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def iter_configs(sweep, repeats=1):
+    """
+    Yields one game config per combination of the values in `sweep` (a dict of parameter -> list
+    of values), `repeats` times each. Parameters not in the sweep take their DEFAULT_CONFIG value.
+    """
+    unknown = set(sweep) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}")
+    keys = list(sweep)
+    for values in itertools.product(*(sweep[k] for k in keys)):
+        for _ in range(repeats):
+            yield {**DEFAULT_CONFIG, **dict(zip(keys, values))}
+
+
+def build_game(config, seed=None, tracer=None, belief_store=None):
+    """
+    Creates the true SocialNetwork of a game and the estimated networks of its contestants.
+    Every random draw of the game comes from streams derived from `seed`.
+    With a `belief_store` filename, the estimated networks keep their beliefs in that
+    memory-mapped file (see SocialNetwork.store_beliefs_in).
+    """
+    net = SocialNetwork(
+        n_interactions=config["n_interactions"],
+        gossip_rate=config["gossip_rate"],
+        interaction_handler=RandomInteractionHandler(config["success_prob"]),
+        dense_trust=True,
+        verbose=False,
+        tracer=tracer,
+        seed=seed,
+    )
+    mix = parse_strategy_mix(config["strategy_mix"])
+    strategies = net.rng.choice(
+        list(mix), size=config["n_contestants"], p=list(mix.values())
+    )
+    for i, strategy in enumerate(strategies):
+        net.add_contestant(
+            Contestant(
+                name=f"C{i}",
+                voting_strategy=VOTING_STRATEGIES[strategy](),
+                interaction_strategy=INTERACTION_STRATEGIES[
+                    config["interaction_strategy"]
+                ](),
+                immutable_traits=ImmutableTraits(
+                    trust_threshold=config["trust_threshold"]
+                ),
+            )
+        )
+    with nullcontext() if tracer is None else tracer.span("snapshot"):
+        base = FrozenSocialNetwork(net)
+    if belief_store is not None:
+        base.store_beliefs_in(belief_store)
+    for c in net.iter_contestants():
+        c.generate_estimated_social_network(base)
+    return net
+
+
+def play_game(net, mc_trials=0, checkpoint=None, progress=None):
+    """
+    Plays a game to the end without any plotting.
+    With `checkpoint` (a directory), the game is saved there after every round, along with its
+    progress. To resume, pass the network and progress returned by load_checkpoint.
+    :return: (names of the evicted contestants in order, round of the split or None,
+        Divergence.summary of the estimated networks at each vote)
+    """
+    progress = _start_game(net) if progress is None else progress
+    while not progress["over"]:
+        net.interaction_phase()
+        _before_vote(net, mc_trials, progress)
+        _after_vote(net, net.voting_phase(), progress, checkpoint)
+    return progress["evictions"], progress["split_round"], progress["divergence"]
+
+
+async def play_game_async(
+    net, mc_trials=0, checkpoint=None, progress=None, timeout=None
+):
+    """
+    play_game with concurrent interaction and voting phases, for contestants whose strategies
+    wait on agent backends (see components.Backends): every contestant is queried at once, and
+    those who do not answer within `timeout` seconds skip their interaction or split.
+    The simulated votes of MC simulations are queried the same way, see
+    SocialNetwork.MC_simulate_all_async.
+    With strategies which do not wait, the game is the same as with play_game.
+    """
+    progress = _start_game(net) if progress is None else progress
+    while not progress["over"]:
+        await net.interaction_phase_async(timeout)
+        net.gossip_phase()
+        if mc_trials:
+            await net.MC_simulate_all_async(mc_trials, timeout=timeout)
+        _record_divergence(net, progress)
+        _after_vote(net, await net.voting_phase_async(timeout), progress, checkpoint)
+    return progress["evictions"], progress["split_round"], progress["divergence"]
+
+
+def _start_game(net):
+    net.sample_trust()
+    return {
+        "round": 0,
+        "evictions": [],
+        "split_round": None,
+        "over": False,
+        "divergence": [],
+    }
+
+
+def _before_vote(net, mc_trials, progress):
+    net.gossip_phase()
+    if mc_trials:
+        net.MC_simulate_all(mc_trials, processes=1)
+    _record_divergence(net, progress)
+
+
+def _record_divergence(net, progress):
+    # How far the beliefs the vote is cast on are from the truth
+    _, metrics = Divergence.divergence(net)
+    progress["divergence"].append(Divergence.summary(metrics))
+
+
+def _after_vote(net, outcome, progress, checkpoint):
+    if net.split:
+        progress["split_round"] = progress["round"]
+        progress["over"] = True
+    else:
+        progress["evictions"].append(outcome.name)
+        net.voting_outcome_reaction_phase(outcome)
+        progress["over"] = len(net.get_all_contestants()) == 1
+    progress["round"] += 1
+    if checkpoint is not None:
+        save_checkpoint(net, checkpoint, progress)
+
+
+def run_game(config, seed, game_id=0, checkpoint_dir=None):
+    """
+    Process pool entry point: plays one game with its own seed and returns its outcome row.
+    With `checkpoint_dir`, the game is checkpointed in it after every round, and resumed from
+    its checkpoint if there already is one.
+    """
+    checkpoint = None
+    progress = None
+    if checkpoint_dir is not None:
+        checkpoint = os.path.join(checkpoint_dir, f"game_{game_id}")
+    if checkpoint is not None and checkpoint_exists(checkpoint):
+        net, progress = load_checkpoint(checkpoint)
+    else:
+        net = build_game(config, seed)
+    evictions, split_round, divergence = play_game(
+        net, config["mc_trials"], checkpoint, progress
+    )
+    remaining = net.get_all_contestants()
+    # Final trust between all contestants of the game, evicted ones included
+    n = net.trust_matrix.size
+    trust = net.trust_matrix.trust_mean[:n, :n][~np.eye(n, dtype=bool)]
+    return {
+        "game_id": game_id,
+        "seed": seed,
+        **{k: config[k] for k in DEFAULT_CONFIG},
+        "n_rounds": len(evictions) + (split_round is not None),
+        "split_round": -1 if split_round is None else split_round,
+        "eviction_order": ";".join(evictions),
+        "remaining": ";".join(c.name for c in remaining),
+        "trust_mean": float(trust.mean()) if trust.size else float("nan"),
+        "trust_std": float(trust.std()) if trust.size else float("nan"),
+        "trust_min": float(trust.min()) if trust.size else float("nan"),
+        "trust_max": float(trust.max()) if trust.size else float("nan"),
+        # Divergence of the estimated networks, averaged over the votes
+        **{
+            f"belief_{metric}": _mean_of_rounds(divergence, metric)
+            for metric in Divergence.METRICS
+        },
+    }
+
+
+def run_sweep(
+    sweep, filename, repeats=1, processes=None, seed=None, checkpoint_dir=None
+):
+    """
+    Runs every game of the sweep on a process pool, streaming outcome rows to `filename` as games
+    finish. Parquet is used for .parquet files (requires pyarrow), CSV otherwise.
+    Each game's seed is spawned from `seed`, so the set of outcomes does not depend on `processes`.
+    With `checkpoint_dir`, every game is checkpointed after each round, so an interrupted sweep
+    run again with the same arguments resumes its games (finished ones are not replayed).
+    :return: the number of games played
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    games = (
+        (config, _spawn_seed(seed_sequence), game_id, checkpoint_dir)
+        for game_id, config in enumerate(iter_configs(sweep, repeats))
+    )
+    n_games = 0
+    with _open_writer(filename) as writer:
+        if processes == 1:
+            for game in games:
+                writer.write(run_game(*game))
+                n_games += 1
+            return n_games
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # Only keep a bounded number of games in flight, so outcomes never pile up in memory
+            max_pending = 4 * (processes or os.cpu_count())
+            pending = set()
+            for game in games:
+                pending.add(executor.submit(run_game, *game))
+                n_games += 1
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        writer.write(future.result())
+            for future in as_completed(pending):
+                writer.write(future.result())
+    return n_games
+
+
+class CSVOutcomeWriter:
+    def __init__(self, filename):
+        self.file = open(filename, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=OUTCOME_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetOutcomeWriter:
+    """Buffers `batch_size` rows at a time and writes each batch as a row group."""
+
+    def __init__(self, filename, batch_size=1000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Writing parquet files requires pyarrow") from e
+        self.pa = pa
+        self.batch_size = batch_size
+        self.rows = []
+        self.schema = None
+        self.writer = None
+        self.filename = filename
+        self.pq = pq
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.pa.Table.from_pylist(self.rows, schema=self.schema)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = self.pq.ParquetWriter(self.filename, self.schema)
+        self.writer.write_table(table)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_writer(filename):
+    if str(filename).endswith(".parquet"):
+        return ParquetOutcomeWriter(filename)
+    return CSVOutcomeWriter(filename)
+
+
+def _spawn_seed(seed_sequence):
+    """Spawning one child at a time yields the same seeds as spawning them all at once."""
+    return int(seed_sequence.spawn(1)[0].generate_state(1, np.uint64)[0])
+
+
+def _mean_of_rounds(divergence, metric):
+    values = [r[metric] for r in divergence if r[metric] is not None]
+    return sum(values) / len(values) if values else float("nan")
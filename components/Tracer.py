@@ -0,0 +1,129 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Records wall time, call counts and (optionally) peak memory of the phases of a game.
+    Pass it to a SocialNetwork as `tracer`; estimated social networks share the tracer of their base.
+    Spans are aggregated per name, and the first `max_events` are also kept as a timeline which can
+    be exported in the Chrome trace format (chrome://tracing, Perfetto).
+    With trace_allocations, the peak of a span is the most memory traced by tracemalloc at any
+    point of the span, above what was traced when it started; spans of the same name report their
+    highest peak. Memory freed before the span ends still counts, so the peak is never negative.
+    """
+
+    def __init__(self, trace_allocations=False, max_events=100000):
+        self.trace_allocations = trace_allocations
+        self.max_events = max_events
+        self.events = []
+        # name -> [calls, total seconds, highest peak bytes]
+        self.stats = {}
+        # Highest traced memory seen in each open span before its nested spans reset the peak
+        self.peaks = []
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def span(self, name, category="phase", **args):
+        if self.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.peaks:
+                self.peaks[-1] = max(self.peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self.peaks.append(current)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            peak = 0
+            if self.trace_allocations:
+                highest = max(tracemalloc.get_traced_memory()[1], self.peaks.pop())
+                peak = highest - current
+                if self.peaks:
+                    self.peaks[-1] = max(self.peaks[-1], highest)
+            stats = self.stats.setdefault(name, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += end - start
+            stats[2] = max(stats[2], peak)
+            if len(self.events) < self.max_events:
+                event = {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": (start - self.origin) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": self.pid,
+                    "tid": threading.get_ident(),
+                }
+                if args or self.trace_allocations:
+                    event["args"] = {**args}
+                    if self.trace_allocations:
+                        event["args"]["peak_bytes"] = peak
+                self.events.append(event)
+
+    def export_chrome_trace(self, filename):
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+    def export_json(self, filename):
+        """Writes the aggregated statistics per span name."""
+        with open(filename, "w") as f:
+            json.dump(
+                {
+                    name: {
+                        "calls": calls,
+                        "seconds": seconds,
+                        "peak_bytes": peak,
+                    }
+                    for name, (calls, seconds, peak) in self.stats.items()
+                },
+                f,
+                indent=2,
+            )
+
+    def summary(self):
+        """Returns a table of the spans, slowest first."""
+        lines = [
+            f"{'span':44} {'calls':>9} {'total s':>10} {'mean ms':>10} {'peak MiB':>10}"
+        ]
+        for name, (calls, seconds, peak) in sorted(
+            self.stats.items(), key=lambda item: -item[1][1]
+        ):
+            lines.append(
+                f"{name:44} {calls:9d} {seconds:10.4f} {1000 * seconds / calls:10.4f} "
+                f"{peak / 2**20:10.2f}"
+            )
+        return "\n".join(lines)
+
+    def __deepcopy__(self, memo):
+        # Copies of a network (such as the base of estimated networks) report to the same tracer
+        return self
+
+
+def traced(name):
+    """
+    Decorator for methods of objects with a `tracer` attribute, recording each call as a span.
+    When the tracer is None, the only overhead is one attribute lookup.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            tracer = self.tracer
+            if tracer is None:
+                return method(self, *args, **kwargs)
+            with tracer.span(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class TrustMatrix:
+    """
+    Dense storage for the trust values of a SocialNetwork.
+    Entry [i, j] of each array is the trust of contestant i towards contestant j, where
+    i and j are the ids handed out by `add`. Unrealized trust is stored as NaN.
+    """
+
+    def __init__(self, capacity=8):
+        self.ids = {}
+        self.contestants = []
+        self.active = np.zeros(capacity, dtype=bool)
+        self.trust_mean = np.zeros((capacity, capacity))
+        self.trust_var = np.zeros((capacity, capacity))
+        self.realized_trust = np.full((capacity, capacity), np.nan)
+        # Bumped by every write to trust_mean or trust_var through a TrustView
+        self.version = 0
+
+    @property
+    def size(self):
+        """Number of ids handed out so far (including removed contestants)."""
+        return len(self.contestants)
+
+    def add(self, contestant):
+        if contestant.name in self.ids:
+            raise ValueError(f"Contestant {contestant} already has a trust matrix id")
+        if self.size == len(self.active):
+            self._grow(2 * len(self.active))
+        idx = self.size
+        self.ids[contestant.name] = idx
+        self.contestants.append(contestant)
+        self.active[idx] = True
+        return idx
+
+    def remove(self, contestant):
+        """Ids are never reused, the row and column of the contestant are simply deactivated."""
+        self.active[self.ids[contestant.name]] = False
+
+    def index(self, contestant):
+        return self.ids[contestant.name]
+
+    def cell(self, name, other_name):
+        """Entry holding the trust of `name` towards `other_name`."""
+        return self.ids[name], self.ids[other_name]
+
+    def arrays(self, ids):
+        """Dense (trust_mean, trust_var) between the contestant ids `ids`."""
+        grid = np.ix_(ids, ids)
+        return self.trust_mean[grid], self.trust_var[grid]
+
+    def sample(self, rng):
+        """Draws every realized trust value from its Gaussian in one vectorized call on `rng`."""
+        n = self.size
+        self.realized_trust[:n, :n] = rng.normal(
+            self.trust_mean[:n, :n], self.trust_var[:n, :n]
+        )
+
+    def clear_realized(self):
+        self.realized_trust[:] = np.nan
+
+    def true_trust(self, contestant):
+        """
+        Returns a dict of neighbour -> trust of `contestant` towards that neighbour, using the
+        mean where the variance is 0 and the realized trust otherwise.
+        """
+        i = self.index(contestant)
+        n = self.size
+        others = np.flatnonzero(self.active[:n])
+        others = others[others != i]
+        var = self.trust_var[i, others]
+        trust = np.where(
+            var == 0, self.trust_mean[i, others], self.realized_trust[i, others]
+        )
+        assert not np.isnan(
+            trust
+        ).any(), "If trust variance > 0, realized trust must exist"
+        return {self.contestants[j]: t for j, t in zip(others, trust.tolist())}
+
+    def _grow(self, capacity):
+        old = len(self.active)
+        self.active = np.concatenate(
+            [self.active, np.zeros(capacity - old, dtype=bool)]
+        )
+        for field, fill in (
+            ("trust_mean", 0.0),
+            ("trust_var", 0.0),
+            ("realized_trust", np.nan),
+        ):
+            grown = np.full((capacity, capacity), fill)
+            grown[:old, :old] = getattr(self, field)
+            setattr(self, field, grown)
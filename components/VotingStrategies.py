@@ -1,23 +1,58 @@
-import random
-
 import numpy as np
 
+from components.Backends import run_sync
 from components.Signals import SplitSignal
 
 
 class VotingStrategy:
-    def choose(self, voter):
+    # Whether choose_batch is implemented
+    supports_batch = False
+
+    def choose(self, voter, net=None):
+        """
+        Returns the contestant `voter` votes out, or SplitSignal.
+        `net` is the network whose beliefs the voter acts on, by default their estimated social network.
+        """
+        raise Exception("This function should be overwritten by derived class!")
+
+    async def choose_async(self, voter, net=None):
+        """
+        `choose` for concurrent voting phases, see SocialNetwork.collect_votes_async.
+        By default it simply runs `choose`; strategies which wait on an agent backend override it.
+        """
+        return self.choose(voter, net)
+
+    def choose_batch(self, voters, trust, immune, rng):
+        """
+        Optional vectorized `choose` for a vote where every voter uses this strategy.
+        trust: (N, N) array where [i, j] is the trust voters[i] acts on towards voters[j]
+        (infinite for yourself and contestants you have no relationship with),
+        immune: (N,) bool mask of the voters who cannot be voted out.
+        Returns the votes of all voters, in order.
+        """
         raise Exception("This function should be overwritten by derived class!")
 
 
 class RandomVoteChoice(VotingStrategy):
-    def choose(self, voter):
-        contestants = [
-            c
-            for c in voter.estimated_social_network.get_all_contestants()
-            if c is not voter and not c.immune_from_votes
+    supports_batch = True
+
+    def choose(self, voter, net=None):
+        net = voter.estimated_social_network if net is None else net
+        contestants = [c for c in net.neighbours(voter) if not net.is_immune(c)]
+        choices = contestants + [SplitSignal]
+        return choices[net.rng.integers(len(choices))]
+
+    def choose_batch(self, voters, trust, immune, rng):
+        candidates = np.isfinite(trust) & ~immune[None, :]
+        n_choices = candidates.sum(axis=1) + 1
+        picks = (rng.random(len(voters)) * n_choices).astype(int)
+        # The k-th candidate of a row is where its running count of candidates reaches k + 1
+        ranks = np.cumsum(candidates, axis=1)
+        votes = (candidates & (ranks == picks[:, None] + 1)).argmax(axis=1)
+        return [
+            SplitSignal if pick == n - 1 else voters[vote]
+            for pick, n, vote in zip(picks.tolist(), n_choices.tolist(), votes.tolist())
         ]
-        return random.choice(contestants + [SplitSignal])
 
 
 class TrustVoteChoice(VotingStrategy):
@@ -25,9 +60,14 @@ class TrustVoteChoice(VotingStrategy):
     Trust-based vote: Split if voter trusts all its neighbours at least voter.trust_threshold
     """
 
-    def choose(self, voter):
+    supports_batch = True
+
+    def choose(self, voter, net=None):
+        net = voter.estimated_social_network if net is None else net
         trust = {
-            c: t for c, t in voter.get_true_trust().items() if not c.immune_from_votes
+            c: t
+            for c, t in voter.get_true_trust(net).items()
+            if not net.is_immune(c)
         }
         trust_voter = np.array(list(trust.items()))
         if trust == {}:
@@ -40,7 +80,79 @@ class TrustVoteChoice(VotingStrategy):
             return SplitSignal
         else:
             # Choose any agent with lowest trust score
-            vote_out = np.random.choice(
+            vote_out = net.rng.choice(
                 np.where(trust_voter[:, 1] == np.min(trust_voter[:, 1]))[0]
             )
             return trust_voter[vote_out, 0]
+
+    def choose_batch(self, voters, trust, immune, rng):
+        thresholds = np.array(
+            [v.immutable_traits.trust_threshold for v in voters], dtype=float
+        )
+        votes = self.resolve(trust, immune, thresholds, rng)
+        return [SplitSignal if vote < 0 else voters[vote] for vote in votes.tolist()]
+
+    @staticmethod
+    def resolve(trust, immune, thresholds, rng, overwrite_trust=False):
+        """
+        Vectorized TrustVoteChoice over any number of leading (game) dimensions.
+        trust: (..., N, N) trust of every voter towards every contestant, immune: (..., N) mask.
+        With overwrite_trust, `trust` is used as scratch space instead of being copied.
+        Returns (..., N) votes, holding the index of the voted contestant or -1 for a split.
+        """
+        diagonal = np.arange(trust.shape[-1])
+        if overwrite_trust:
+            np.copyto(trust, np.inf, where=immune[..., None, :])
+        else:
+            trust = np.where(immune[..., None, :], np.inf, trust)
+        trust[..., diagonal, diagonal] = np.inf
+        votes = trust.argmin(axis=-1)
+        lowest = np.take_along_axis(trust, votes[..., None], axis=-1)[..., 0]
+        # Any agent with lowest trust may be chosen, so break exact ties at random
+        at_lowest = trust == lowest[..., None]
+        tied = (np.count_nonzero(at_lowest, axis=-1) > 1) & np.isfinite(lowest)
+        if tied.any():
+            candidates = at_lowest[tied]
+            keys = rng.random(candidates.shape, dtype=np.float32)
+            keys += 1
+            keys *= candidates
+            votes[tied] = keys.argmax(axis=-1)
+        # Split when nobody can be chosen or everyone is trusted above the threshold
+        votes[lowest > thresholds] = -1
+        return votes
+
+
+class BackendVoteChoice(VotingStrategy):
+    """
+    Votes are chosen by a policy running on an AgentBackend (see components.Backends), which gets
+    the voter's threshold and their trust towards every contestant they can vote out.
+    Contestants with this strategy cannot be saved in checkpoints.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def choose(self, voter, net=None):
+        return run_sync(self.choose_async(voter, net))
+
+    async def choose_async(self, voter, net=None):
+        net = voter.estimated_social_network if net is None else net
+        trust = {
+            c: t
+            for c, t in voter.get_true_trust(net).items()
+            if not net.is_immune(c)
+        }
+        candidates = {c.name: c for c in trust}
+        vote = await self.backend.submit(
+            "vote",
+            {
+                "voter": voter.name,
+                "threshold": voter.immutable_traits.trust_threshold,
+                "candidates": {c.name: t for c, t in trust.items()},
+            },
+        )
+        if vote is None:
+            return SplitSignal
+        if vote not in candidates:
+            raise ValueError(f"{voter} cannot vote for {vote!r}")
+        return candidates[vote]
@@ -1,8 +1,9 @@
 import random
 import time
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
 
 from components.Contestant import Contestant
+from components.EstimatedSocialNetwork import FrozenSocialNetwork
 from components.InteractionStrategies import RandomInteractionChoice
 from components.SocialNetwork import SocialNetwork
 from components.VotingStrategies import RandomVoteChoice, TrustVoteChoice
@@ -26,26 +27,28 @@ def main():
     # game_network.plot()
 
     # Estimated social networks are generated here
-    copynet = deepcopy(game_network)
+    base = FrozenSocialNetwork(game_network)
     for c in game_network.iter_contestants():
-        c.generate_estimated_social_network(copynet)
-    del copynet
+        c.generate_estimated_social_network(base)
 
     game_network.sample_trust()
-    for round_i in range(len(contestants)):
-        game_network.plot()
-        time.sleep(0.1)
-        game_network.interaction_phase()
-        for c in game_network.iter_contestants():
-            MC_results = c.MC_simulate_games(100)
-            # print(f"{c} Thinks {ret[0]} will be evicted!")
-            print(f"MC Results Simulated for {c.name}")
-        outcome = game_network.voting_phase()
-        if game_network.split:
-            break
-        game_network.voting_outcome_reaction_phase(outcome)
-        if len(game_network.get_all_contestants()) == 1:
-            break
+    # One process pool for the MC simulations of every round
+    with ProcessPoolExecutor() as executor:
+        for round_i in range(len(contestants)):
+            game_network.plot()
+            time.sleep(0.1)
+            game_network.interaction_phase()
+            game_network.gossip_phase()
+            MC_results = game_network.MC_simulate_all(100, executor=executor)
+            for c in MC_results:
+                # print(f"{c} Thinks {ret[0]} will be evicted!")
+                print(f"MC Results Simulated for {c.name}")
+            outcome = game_network.voting_phase()
+            if game_network.split:
+                break
+            game_network.voting_outcome_reaction_phase(outcome)
+            if len(game_network.get_all_contestants()) == 1:
+                break
 
     game_network.plot()
     game_network.save_animation_as_gif()
@@ -0,0 +1,25 @@
+import argparse
+
+from components.Replay import render_replay
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Renders a game event log (see SocialNetwork.log_events_to) into an animation."
+    )
+    parser.add_argument("events", help="Event log written during the game")
+    parser.add_argument(
+        "output", nargs="?", default="animation.gif", help="GIF or MP4 file"
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--duration", type=int, default=200, help="ms per frame")
+    args = parser.parse_args()
+
+    n_frames = render_replay(
+        args.events, args.output, processes=args.processes, duration=args.duration
+    )
+    print(f"Animation of {n_frames} frames saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from components import Analytic, MonteCarlo
+from components.Tournament import DEFAULT_CONFIG, build_game
+
+N_GAMES = 20000
+
+
+def assert_close(analytic, sampled, n=N_GAMES):
+    """Sampled frequencies must be within 5 standard errors of the analytic probabilities."""
+    analytic, sampled = np.asarray(analytic), np.asarray(sampled)
+    tolerance = 5 * np.sqrt(analytic * (1 - analytic) / n) + 1e-3
+    assert np.all(np.abs(analytic - sampled) <= tolerance), (analytic, sampled)
+
+
+def sampled_first_vote(trust_mean, trust_var, thresholds, immune, seed=0):
+    """Frequencies of the outcomes of one vote of the batched engine, with a split last."""
+    rng = np.random.default_rng(seed)
+    n_contestants = len(thresholds)
+    realized = MonteCarlo.sample_trust(trust_mean, trust_var, N_GAMES, rng)
+    votes = MonteCarlo.resolve_votes(
+        realized, np.tile(immune, (N_GAMES, 1)), thresholds, rng
+    )
+    outcome = MonteCarlo.count_votes(votes, n_contestants)
+    outcome[outcome == MonteCarlo.SPLIT] = n_contestants
+    return np.bincount(outcome, minlength=n_contestants + 1) / N_GAMES
+
+
+def analytic_first_vote(trust_mean, trust_var, thresholds, immune):
+    return Analytic.eviction_probabilities(
+        Analytic.vote_probabilities(trust_mean, trust_var, thresholds, immune)
+    )
+
+
+@pytest.mark.parametrize("trust_threshold", [-1, 0, 1])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_next_vote_distribution_matches_MC(trust_threshold, seed):
+    net = build_game(
+        {**DEFAULT_CONFIG, "n_contestants": 6, "trust_threshold": trust_threshold},
+        seed=seed,
+    )
+    # A few interactions, so that trust differs between contestants
+    net.sample_trust()
+    for _ in range(3):
+        net.interaction_phase()
+    for c in net.iter_contestants():
+        estimated = c.estimated_social_network
+        analytic = Analytic.next_vote_distribution(estimated)[1]
+        sampled = MonteCarlo.MC_simulate_games(
+            estimated, N_GAMES, rng=np.random.default_rng(seed)
+        )[1]
+        outcomes = list(set(analytic) | set(sampled))
+        assert_close(
+            [analytic.get(o, 0.0) for o in outcomes],
+            [sampled.get(o, 0.0) for o in outcomes],
+        )
+
+
+@pytest.mark.parametrize("threshold", [-2.0, -0.5, 0.0, 1.0])
+def test_vote_thresholds(threshold):
+    rng = np.random.default_rng(3)
+    trust_mean = rng.integers(-2, 3, (5, 5)).astype(float)
+    trust_var = np.zeros((5, 5))
+    trust_var[:, 0] = 1.5
+    trust_var[0, 0] = 0
+    thresholds = np.full(5, threshold)
+    immune = np.zeros(5, dtype=bool)
+    assert_close(
+        analytic_first_vote(trust_mean, trust_var, thresholds, immune),
+        sampled_first_vote(trust_mean, trust_var, thresholds, immune),
+    )
+
+
+def test_ties_between_certain_trust():
+    # Every voter trusts two contestants equally and for certain, and one uncertainly
+    trust_mean = np.array(
+        [
+            [0.0, -1.0, -1.0, 0.0],
+            [-1.0, 0.0, -1.0, 0.0],
+            [-1.0, -1.0, 0.0, 0.0],
+            [-1.0, -1.0, 0.0, 0.0],
+        ]
+    )
+    trust_var = np.zeros((4, 4))
+    trust_var[:3, 3] = 1.0
+    thresholds = np.zeros(4)
+    immune = np.zeros(4, dtype=bool)
+    analytic = analytic_first_vote(trust_mean, trust_var, thresholds, immune)
+    assert analytic[1] > 0 and analytic[2] > 0
+    assert_close(
+        analytic, sampled_first_vote(trust_mean, trust_var, thresholds, immune)
+    )
+
+
+def test_immune_candidates():
+    rng = np.random.default_rng(4)
+    trust_mean = rng.normal(0, 1, (5, 5))
+    np.fill_diagonal(trust_mean, 0)
+    trust_var = np.zeros((5, 5))
+    trust_var[:, 1] = 1.0
+    trust_var[:, 4] = 0.5
+    thresholds = np.full(5, 0.5)
+    immune = np.array([False, True, False, False, True])
+    analytic = analytic_first_vote(trust_mean, trust_var, thresholds, immune)
+    assert analytic[1] == 0 and analytic[4] == 0
+    assert_close(
+        analytic, sampled_first_vote(trust_mean, trust_var, thresholds, immune)
+    )
+
+    # Voters with only immune candidates split
+    immune = np.ones(5, dtype=bool)
+    np.testing.assert_allclose(
+        analytic_first_vote(trust_mean, trust_var, thresholds, immune),
+        [0, 0, 0, 0, 0, 1],
+    )
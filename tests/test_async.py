@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from components.Backends import LocalBackend, threshold_policy
+from components.InteractionStrategies import BackendInteractionChoice
+from components.Tournament import (DEFAULT_CONFIG, build_game, play_game,
+                                   play_game_async)
+from components.VotingStrategies import BackendVoteChoice
+
+CONFIG = {**DEFAULT_CONFIG, "n_contestants": 5}
+
+
+def with_backend(net, names):
+    backend = LocalBackend(threshold_policy)
+    for c in net.iter_contestants():
+        if c.name in names:
+            c.voting_strategy = BackendVoteChoice(backend)
+            c.interaction_strategy = BackendInteractionChoice(backend)
+    return net
+
+
+def test_async_game_matches_sync_game():
+    assert asyncio.run(play_game_async(build_game(CONFIG, seed=2))) == play_game(
+        build_game(CONFIG, seed=2)
+    )
+
+
+@pytest.mark.parametrize("names", [{"C0"}, {"C0", "C1", "C2", "C3", "C4"}])
+def test_async_game_with_MC_and_backend_voters(names):
+    net = with_backend(build_game(CONFIG, seed=1), names)
+    evictions, split_round, divergence = asyncio.run(
+        play_game_async(net, mc_trials=5, timeout=10)
+    )
+    assert len(divergence) == len(evictions) + (split_round is not None)
+    assert len(set(evictions)) == len(evictions)
+    # Every contestant's beliefs were simulated before each vote
+    assert all(len(c.estimated_social_network.mc_cache) for c in net.iter_contestants())
+
+
+def test_sync_backend_choice_in_running_loop_raises():
+    net = with_backend(build_game(CONFIG, seed=1), {"C0"})
+    net.sample_trust()
+    voter = net.get_all_contestants()[0]
+
+    async def vote():
+        return voter.voting_strategy.choose(voter)
+
+    with pytest.raises(RuntimeError, match="running event loop"):
+        asyncio.run(vote())
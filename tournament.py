@@ -0,0 +1,59 @@
+import argparse
+
+from components.Tournament import DEFAULT_CONFIG, run_sweep
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Plays a sweep of headless games and streams their outcomes to a file."
+    )
+    parser.add_argument("output", help="Outcome file, .parquet (needs pyarrow) or .csv")
+    parser.add_argument("--n-contestants", type=int, nargs="+", default=[5])
+    parser.add_argument(
+        "--strategy-mix",
+        nargs="+",
+        default=["trust"],
+        help='Voting strategy mixes, e.g. "trust" or "trust=3,random=1"',
+    )
+    parser.add_argument("--interaction-strategy", nargs="+", default=["random"])
+    parser.add_argument("--trust-threshold", type=float, nargs="+", default=[-1])
+    parser.add_argument("--success-prob", type=float, nargs="+", default=[0.75])
+    parser.add_argument("--n-interactions", type=int, nargs="+", default=[1])
+    parser.add_argument(
+        "--gossip-rate",
+        type=float,
+        nargs="+",
+        default=[0.0],
+        help="How far beliefs move towards those of trusted neighbours each round (0 for no gossip)",
+    )
+    parser.add_argument(
+        "--mc-trials",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="MC simulations per contestant per round (0 to skip)",
+    )
+    parser.add_argument("--repeats", type=int, default=1, help="Games per combination")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--checkpoint-dir",
+        default=None,
+        help="Checkpoint every game after each round, and resume the games checkpointed there",
+    )
+    args = parser.parse_args()
+
+    sweep = {k: getattr(args, k) for k in DEFAULT_CONFIG}
+    n_games = run_sweep(
+        sweep,
+        args.output,
+        repeats=args.repeats,
+        processes=args.processes,
+        seed=args.seed,
+        checkpoint_dir=args.checkpoint_dir,
+    )
+    print(f"Played {n_games} games, outcomes saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()